@@ -4,3 +4,20 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.conf import settings
+        from django.core.signals import request_started
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .db import check_connections, connection_opened
+
+        connection_created.connect(connection_opened)
+        request_started.connect(check_connections)
+        if settings.METRICS_ENABLED:
+            from .metrics import (install_query_recorder,
+                                  install_serializer_timing)
+
+            connection_created.connect(install_query_recorder)
+            install_serializer_timing()
@@ -0,0 +1,39 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .db import check_connections
+
+
+def run_view(view, request, *args, **kwargs):
+    close_old_connections()
+    check_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        if response.streaming:
+            response.streaming_content = list(response.streaming_content)
+        return response
+    finally:
+        close_old_connections()
+
+
+def offload(view):
+    """Асинхронная обертка над синхронным view для ASGI.
+
+    В Django 3.2 нет асинхронного ORM, поэтому view целиком, включая
+    запросы к базе и рендеринг ответа, выполняется в пуле потоков.
+    Чтения идут параллельно в отдельных потоках со своими
+    соединениями; изменяющие запросы выполняются в общем
+    thread-sensitive потоке, как и обычные синхронные view.
+    """
+    @wraps(view)
+    async def async_view(request, *args, **kwargs):
+        return await sync_to_async(
+            run_view,
+            thread_sensitive=request.method not in SAFE_METHODS
+        )(view, request, *args, **kwargs)
+    return async_view
@@ -0,0 +1,42 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from foodgram.routers import use_primary
+
+
+def token_cache_key(key):
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def revoke_user_tokens(user_id):
+    cache.delete_many([
+        token_cache_key(key) for key in Token.objects.filter(
+            user_id=user_id).values_list('key', flat=True)
+    ])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с кэшированием пользователя по токену.
+
+    Запись живет AUTH_TOKEN_CACHE_TIMEOUT секунд и удаляется при
+    выходе, удалении токена и изменении пользователя (смена пароля,
+    деактивация), см. api/signals.py. Отзыв виден всем воркерам только
+    с общим кэшем, поэтому с LocMemCache кэширование отключено.
+    """
+
+    def authenticate_credentials(self, key):
+        if not settings.AUTH_TOKEN_CACHE_TIMEOUT:
+            with use_primary():
+                return super().authenticate_credentials(key)
+        cache_key = token_cache_key(key)
+        user = cache.get(cache_key)
+        if user is not None:
+            return user, Token(key=key, user=user)
+        with use_primary():
+            user, token = super().authenticate_credentials(key)
+        cache.set(cache_key, user, settings.AUTH_TOKEN_CACHE_TIMEOUT)
+        return user, token
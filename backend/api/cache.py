@@ -0,0 +1,64 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from foodgram.routers import use_primary
+from recipes.cache import get_version
+from recipes.models import Recipe, Tag
+
+
+class ReferenceCacheMixin:
+    """Кэширует ответы справочников (тэги, ингредиенты).
+
+    Ключ кэша и ETag строятся из версии справочника, которую сигналы
+    увеличивают при любом изменении модели. Запрос с актуальным ETag
+    получает 304 без обращения к базе и сериализаторам.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, method, request, *args, **kwargs):
+        model = self.queryset.model
+        version = get_version(model)
+        path_hash = md5(request.get_full_path().encode()).hexdigest()
+        etag = quote_etag(
+            f'{model._meta.model_name}-{version}-{path_hash}')
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(version))
+        if response is not None:
+            return response
+        key = f'reference:{etag}'
+        data = cache.get(key)
+        if data is None:
+            with use_primary():
+                response = method(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, settings.REFERENCE_CACHE_TIMEOUT)
+        response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(int(version))
+        return response
+
+
+def recipe_cache_key(request, pk):
+    """Ключ общей для всех пользователей части ответа с рецептом.
+
+    Меняется вместе с версией рецепта (сигналы рецепта, его ингредиентов
+    и автора) и версией справочника тэгов; хост входит в ключ, так как
+    ссылки на изображения абсолютные.
+    """
+    host_hash = md5(request.build_absolute_uri('/').encode()).hexdigest()
+    return (f'recipe:{pk}:{get_version(Recipe, pk)}:'
+            f'{get_version(Tag)}:{host_hash}')
@@ -0,0 +1,47 @@
+import threading
+
+from django.conf import settings
+from django.db import connections
+
+
+class ConnectionStats:
+    """Счетчики соединений с базой текущего процесса."""
+
+    FIELDS = ('opened', 'reused', 'health_check_failures')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = dict.fromkeys(self.FIELDS, 0)
+
+    def increment(self, field):
+        with self._lock:
+            self.counters[field] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters)
+
+
+connection_stats = ConnectionStats()
+
+
+def connection_opened(sender, connection, **kwargs):
+    connection_stats.increment('opened')
+
+
+def check_connections(**kwargs):
+    """Проверяет постоянные соединения перед обработкой запроса.
+
+    В Django 3.2 нет CONN_HEALTH_CHECKS: соединение, закрытое сервером
+    или PgBouncer, обнаруживается только ошибкой первого запроса.
+    Здесь открытые соединения проверяются заранее, а неработающие
+    закрываются, чтобы Django открыл новые.
+    """
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        connection_stats.increment('reused')
+        if (settings.DB_CONN_HEALTH_CHECKS
+                and not connection.is_usable()):
+            connection_stats.increment('health_check_failures')
+            connection.close()
@@ -0,0 +1,46 @@
+import base64
+import binascii
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+
+from recipes.images import ALLOWED_FORMATS
+
+HEADER_CHARS = 4096
+
+
+class StagedImageField(serializers.Field):
+    """Принимает изображение в base64 без полного декодирования.
+
+    Проверяются только размер и заголовок изображения; декодирование
+    и генерация уменьшенных копий выполняются в фоне (recipes.images).
+    Возвращает base64-строку без префикса data:...;base64,.
+    """
+
+    default_error_messages = {
+        'invalid': 'Загрузите корректное изображение в формате base64.',
+        'too_large': 'Размер изображения превышает допустимый.',
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, str):
+            self.fail('invalid')
+        payload = data.rpartition(';base64,')[2].strip()
+        if not payload:
+            self.fail('invalid')
+        if len(payload) * 3 // 4 > settings.IMAGE_MAX_SIZE:
+            self.fail('too_large')
+        try:
+            header = base64.b64decode(payload[:HEADER_CHARS], validate=True)
+            image_format = Image.open(BytesIO(header)).format
+        except (binascii.Error, ValueError, UnidentifiedImageError,
+                OSError):
+            self.fail('invalid')
+        if image_format not in ALLOWED_FORMATS:
+            self.fail('invalid')
+        return payload
+
+    def to_representation(self, value):
+        return value.url if value else None
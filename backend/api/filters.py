@@ -1,27 +1,101 @@
+from django.conf import settings
+from django.db.models import Exists, IntegerField, OuterRef, Value
+from django.db.models.functions import Lower
 from django_filters.rest_framework import filters, FilterSet
+from rest_framework.filters import OrderingFilter
 
-from recipes.models import Tag, Recipe
+from recipes.cache import tag_ids_by_slug
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart
+from recipes.search import search_recipes
 
 
-class RecipeFilter(FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(), field_name='tags__slug',
-        to_field_name='slug')
+def tag_choices():
+    return [(slug, slug) for slug in tag_ids_by_slug()]
+
+
+class StableOrderingFilter(OrderingFilter):
+    """OrderingFilter, дополняющий сортировку из запроса полями ordering
+    view (-pub_date, -id), чтобы рецепты с равными счетчиками не
+    переходили между страницами."""
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        names = {field.lstrip('-') for field in ordering}
+        return [*ordering, *(
+            field for field in getattr(view, 'ordering', None) or ()
+            if field.lstrip('-') not in names
+        )]
+
+
+class IngredientFilter(FilterSet):
+    name = filters.CharFilter(method='get_name')
+
+    def get_name(self, queryset, name, value):
+        """Не больше INGREDIENT_SEARCH_LIMIT ингредиентов: сначала
+        совпадения по началу названия, затем по подстроке.
+
+        В PostgreSQL первая часть идет по btree lower(name)
+        varchar_pattern_ops (миграция 0004) и читает из индекса только
+        первые строки, вторая - по GIN-индексу pg_trgm (миграция 0013).
+        """
+        value = value.lower()
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        queryset = queryset.annotate(lower_name=Lower('name'))
+        prefix = queryset.filter(
+            lower_name__startswith=value
+        ).annotate(is_prefix=Value(0, output_field=IntegerField()))
+        substring = queryset.filter(
+            lower_name__contains=value
+        ).exclude(
+            lower_name__startswith=value
+        ).annotate(is_prefix=Value(1, output_field=IntegerField()))
+        return prefix.order_by('lower_name', 'id')[:limit].union(
+            substring.order_by('lower_name', 'id')[:limit], all=True
+        ).order_by('is_prefix', 'lower_name', 'id')[:limit]
 
+    class Meta:
+        model = Ingredient
+        fields = ['name']
+
+
+class RecipeFilter(FilterSet):
+    tags = filters.MultipleChoiceFilter(choices=tag_choices,
+                                        method='get_tags')
+    author = filters.NumberFilter(field_name='author')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart')
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
+    search = filters.CharFilter(method='get_search')
+
+    def get_tags(self, queryset, name, value):
+        tag_ids = tag_ids_by_slug()
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef('pk'),
+                tag_id__in=[tag_ids[slug] for slug in value]
+            )
+        ))
+
+    def filter_by_user(self, queryset, model, value):
+        if not value:
+            return queryset
+        if not self.request.user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(Exists(model.objects.filter(
+            user=self.request.user, recipe_id=OuterRef('pk'))))
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(shoppingcart__user=self.request.user)
-        return queryset
+        return self.filter_by_user(queryset, ShoppingCart, value)
 
     def get_is_favorited(self, queryset, name, value):
-        if value:
-            return queryset.filter(favorite__user=self.request.user)
-        return queryset
+        return self.filter_by_user(queryset, Favorite, value)
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
 
     class Meta:
         model = Recipe
-        fields = ['tags', 'is_in_shopping_cart', 'is_favorited']
+        fields = ['tags', 'author', 'is_in_shopping_cart', 'is_favorited',
+                  'search']
@@ -0,0 +1,156 @@
+import json
+import random
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Recipe, Tag
+
+User = get_user_model()
+
+PERCENTILES = (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, round(fraction * len(values)) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = "Replay typical API traffic and report latency and queries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--requests', type=int, default=100,
+            help='Количество замеряемых запросов к каждому эндпоинту.'
+        )
+        parser.add_argument(
+            '--warmup', type=int, default=5,
+            help='Количество прогревочных запросов без замера.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--endpoint', action='append', dest='endpoints',
+            help='Замерить только указанные эндпоинты.'
+        )
+        parser.add_argument(
+            '--output', help='Сохранить результаты в JSON-файл.'
+        )
+        parser.add_argument(
+            '--compare', help='JSON-файл прошлого запуска для сравнения.'
+        )
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        scenarios = self.get_scenarios()
+        if options['endpoints']:
+            unknown = set(options['endpoints']) - set(scenarios)
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные эндпоинты: {", ".join(sorted(unknown))}.')
+            scenarios = {name: scenarios[name]
+                         for name in options['endpoints']}
+        client = Client(HTTP_HOST='localhost')
+        results = {}
+        for name, (make_path, headers) in scenarios.items():
+            for _ in range(options['warmup']):
+                self.request(client, make_path(), headers)
+            timings, queries, errors = [], [], 0
+            for _ in range(options['requests']):
+                elapsed, count, status = self.request(
+                    client, make_path(), headers)
+                timings.append(elapsed)
+                queries.append(count)
+                errors += status >= 400
+            results[name] = {
+                'requests': len(timings),
+                'errors': errors,
+                **{key: round(percentile(timings, fraction) * 1000, 2)
+                   for key, fraction in PERCENTILES},
+                'queries_avg': round(sum(queries) / len(queries), 2),
+                'queries_max': max(queries),
+            }
+        baseline = {}
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                baseline = json.load(f)
+        self.report(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2, sort_keys=True)
+                f.write('\n')
+
+    def request(self, client, path, headers):
+        with CaptureQueriesContext(connection) as context:
+            started = perf_counter()
+            response = client.get(path, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            else:
+                response.content
+            elapsed = perf_counter() - started
+        return elapsed, len(context.captured_queries), response.status_code
+
+    def get_scenarios(self):
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        if not recipe_ids:
+            raise CommandError(
+                'Нет рецептов: сначала выполните generatedata.')
+        user = User.objects.annotate(
+            carts=Count('shoppingcart')
+        ).filter(carts__gt=0).order_by('-carts').first()
+        if user is None:
+            raise CommandError(
+                'Нет пользователей со списком покупок: '
+                'сначала выполните generatedata.')
+        token, _ = Token.objects.get_or_create(user=user)
+        auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        slugs = list(Tag.objects.values_list('slug', flat=True))
+
+        def recipe_filter():
+            tags = '&'.join(f'tags={slug}' for slug in random.sample(
+                slugs, random.randint(1, len(slugs))))
+            return f'/api/recipes/?{tags}&is_favorited=1'
+
+        return {
+            'tags': (lambda: '/api/tags/', {}),
+            'ingredients_search': (
+                lambda: '/api/ingredients/?name=' + random.choice(
+                    ('са', 'мол', 'кар', 'яй', 'мук')), {}),
+            'recipes_list': (
+                lambda: f'/api/recipes/?page={random.randint(1, 5)}', {}),
+            'recipes_list_auth': (lambda: '/api/recipes/', auth),
+            'recipes_filter': (recipe_filter, auth),
+            'recipes_detail': (
+                lambda: f'/api/recipes/{random.choice(recipe_ids)}/', auth),
+            'subscriptions': (
+                lambda: '/api/users/subscriptions/?recipes_limit=3', auth),
+            'download_shopping_cart': (
+                lambda: '/api/recipes/download_shopping_cart/', auth),
+        }
+
+    def report(self, results, baseline):
+        print(f'{"endpoint":25} {"req":>5} {"err":>4} {"p50 ms":>8} '
+              f'{"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"max q":>6}'
+              + (f' {"p95 Δ":>8} {"q Δ":>6}' if baseline else ''))
+        for name, stats in results.items():
+            line = (
+                f'{name:25} {stats["requests"]:>5} {stats["errors"]:>4} '
+                f'{stats["p50"]:>8.2f} {stats["p95"]:>8.2f} '
+                f'{stats["p99"]:>8.2f} {stats["queries_avg"]:>8.2f} '
+                f'{stats["queries_max"]:>6}'
+            )
+            previous = baseline.get(name)
+            if previous:
+                change = (stats['p95'] - previous['p95']) / max(
+                    previous['p95'], 1e-6) * 100
+                queries = stats['queries_avg'] - previous['queries_avg']
+                line += f' {change:>+7.1f}% {queries:>+6.1f}'
+            print(line)
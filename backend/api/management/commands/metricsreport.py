@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from api.metrics import registry
+
+
+class Command(BaseCommand):
+    help = "Print per-endpoint latency and query statistics"
+
+    def handle(self, *args, **options):
+        stats = registry.collect()
+        if not stats:
+            print('Метрик нет: включите METRICS_ENABLED и общий кэш.')
+            return
+        print(f'{"endpoint":45} {"count":>7} {"p50":>7} {"p95":>7} '
+              f'{"p99":>7} {"queries":>8} {"db ms":>8} {"ser ms":>8} '
+              f'{"bytes":>9}')
+        for endpoint, endpoint_stats in sorted(
+                stats.items(), key=lambda item: -item[1].latency_sum):
+            count = endpoint_stats.count
+            print(
+                f'{endpoint:45} {count:>7} '
+                f'{endpoint_stats.percentile(0.5):>7} '
+                f'{endpoint_stats.percentile(0.95):>7} '
+                f'{endpoint_stats.percentile(0.99):>7} '
+                f'{endpoint_stats.queries_sum / count:>8.1f} '
+                f'{endpoint_stats.db_time / count * 1000:>8.2f} '
+                f'{endpoint_stats.serializer_time / count * 1000:>8.2f} '
+                f'{endpoint_stats.response_bytes // count:>9}'
+            )
+        connections = registry.collect_connections()
+        print(f'Соединения с БД: открыто {connections["opened"]}, '
+              f'переиспользовано {connections["reused"]}, '
+              f'не прошли проверку {connections["health_check_failures"]}.')
@@ -0,0 +1,309 @@
+import asyncio
+import logging
+import os
+import threading
+from bisect import bisect_left
+from collections import Counter
+from time import monotonic, perf_counter
+
+from asgiref.local import Local
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import serializers
+
+from .db import connection_stats
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, float('inf'))
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, float('inf'))
+SNAPSHOT_KEY = 'metrics:snapshot:{pid}'
+WORKERS_KEY = 'metrics:workers'
+
+_local = Local()
+
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.latency = [0] * len(LATENCY_BUCKETS)
+        self.latency_sum = 0.0
+        self.queries = [0] * len(QUERY_BUCKETS)
+        self.queries_sum = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.response_bytes = 0
+
+    def observe(self, latency, queries, db_time, serializer_time,
+                response_bytes):
+        self.count += 1
+        self.latency[bisect_left(LATENCY_BUCKETS, latency)] += 1
+        self.latency_sum += latency
+        self.queries[bisect_left(QUERY_BUCKETS, queries)] += 1
+        self.queries_sum += queries
+        self.db_time += db_time
+        self.serializer_time += serializer_time
+        self.response_bytes += response_bytes
+
+    def merge(self, other):
+        self.count += other.count
+        self.latency = [a + b for a, b in zip(self.latency, other.latency)]
+        self.latency_sum += other.latency_sum
+        self.queries = [a + b for a, b in zip(self.queries, other.queries)]
+        self.queries_sum += other.queries_sum
+        self.db_time += other.db_time
+        self.serializer_time += other.serializer_time
+        self.response_bytes += other.response_bytes
+
+    def percentile(self, fraction):
+        """Оценка перцентиля задержки по верхней границе корзины."""
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.latency):
+            seen += count
+            if seen >= target:
+                return bound
+        return LATENCY_BUCKETS[-1]
+
+
+class MetricsRegistry:
+    """Метрики эндпоинтов текущего процесса.
+
+    Каждый воркер периодически сохраняет снимок в кэш, откуда их
+    собирают /api/_metrics и команда metricsreport. Чтобы видеть все
+    воркеры, кэш должен быть общим (см. CACHE_BACKEND).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._flushed = monotonic()
+
+    def observe(self, endpoint, **values):
+        with self._lock:
+            self._stats.setdefault(endpoint, EndpointStats()).observe(
+                **values)
+            flush = (monotonic() - self._flushed
+                     >= settings.METRICS_FLUSH_INTERVAL)
+            if flush:
+                self._flushed = monotonic()
+        if flush:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        pid = os.getpid()
+        cache.set(SNAPSHOT_KEY.format(pid=pid),
+                  {'endpoints': snapshot,
+                   'connections': connection_stats.snapshot()}, None)
+        workers = cache.get(WORKERS_KEY, set())
+        if pid not in workers:
+            cache.set(WORKERS_KEY, workers | {pid}, None)
+
+    def snapshots(self):
+        self.flush()
+        for pid in cache.get(WORKERS_KEY, set()):
+            snapshot = cache.get(SNAPSHOT_KEY.format(pid=pid))
+            if snapshot:
+                yield snapshot
+
+    def collect(self):
+        merged = {}
+        for snapshot in self.snapshots():
+            for endpoint, stats in snapshot['endpoints'].items():
+                merged.setdefault(endpoint, EndpointStats()).merge(stats)
+        return merged
+
+    def collect_connections(self):
+        merged = Counter()
+        for snapshot in self.snapshots():
+            merged.update(snapshot['connections'])
+        return merged
+
+
+registry = MetricsRegistry()
+
+
+def render_prometheus(stats, connections):
+    lines = []
+
+    def histogram(name, help_text, buckets, attribute, sum_attribute):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for endpoint, endpoint_stats in sorted(stats.items()):
+            total = 0
+            counts = getattr(endpoint_stats, attribute)
+            for bound, count in zip(buckets, counts):
+                total += count
+                le = '+Inf' if bound == float('inf') else bound
+                lines.append(
+                    f'{name}_bucket{{endpoint="{endpoint}",le="{le}"}} '
+                    f'{total}')
+            lines.append(f'{name}_sum{{endpoint="{endpoint}"}} '
+                         f'{getattr(endpoint_stats, sum_attribute)}')
+            lines.append(f'{name}_count{{endpoint="{endpoint}"}} '
+                         f'{endpoint_stats.count}')
+
+    def counter(name, help_text, attribute):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for endpoint, endpoint_stats in sorted(stats.items()):
+            lines.append(f'{name}{{endpoint="{endpoint}"}} '
+                         f'{getattr(endpoint_stats, attribute)}')
+
+    histogram('foodgram_request_duration_seconds', 'Request wall time.',
+              LATENCY_BUCKETS, 'latency', 'latency_sum')
+    histogram('foodgram_db_queries', 'Database queries per request.',
+              QUERY_BUCKETS, 'queries', 'queries_sum')
+    counter('foodgram_db_duration_seconds_total',
+            'Time spent in database queries.', 'db_time')
+    counter('foodgram_serializer_duration_seconds_total',
+            'Time spent building serializer data.', 'serializer_time')
+    counter('foodgram_response_bytes_total',
+            'Response body size.', 'response_bytes')
+    lines.append('# HELP foodgram_db_connections_total '
+                 'Database connection events.')
+    lines.append('# TYPE foodgram_db_connections_total counter')
+    for event, count in sorted(connections.items()):
+        lines.append(
+            f'foodgram_db_connections_total{{event="{event}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = Counter()
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - started
+            self.queries[sql] += 1
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = getattr(_local, 'metrics', None)
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """Подключает учет запросов к соединению один раз при его открытии.
+
+    Запросы учитываются в любом потоке, где выполняется view: метрики
+    текущего запроса берутся из Local, который asgiref передает и в
+    потоки sync_to_async. Обертка ставится в начало списка, чтобы не
+    мешать execute_wrapper(), который снимает последнюю обертку.
+    """
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, record_query)
+
+
+class TimedProperty(property):
+    pass
+
+
+def timed_data(data_property):
+    if isinstance(data_property, TimedProperty):
+        return data_property
+
+    def data(self):
+        metrics = getattr(_local, 'metrics', None)
+        if metrics is None or metrics.serializer_depth:
+            return data_property.fget(self)
+        metrics.serializer_depth += 1
+        started = perf_counter()
+        try:
+            return data_property.fget(self)
+        finally:
+            metrics.serializer_depth -= 1
+            metrics.serializer_time += perf_counter() - started
+    return TimedProperty(data)
+
+
+def install_serializer_timing():
+    serializers.Serializer.data = timed_data(serializers.Serializer.data)
+    serializers.ListSerializer.data = timed_data(
+        serializers.ListSerializer.data)
+
+
+def endpoint_name(request):
+    view = getattr(request, 'metrics_view', None)
+    if view is None:
+        return 'unresolved'
+    view_class = getattr(view, 'cls', None)
+    if view_class is None:
+        return getattr(view, '__name__', 'view')
+    actions = getattr(view, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class MetricsMiddleware:
+    """Собирает время ответа, число и время SQL-запросов, время
+    сериализации и размер ответа по каждому действию view.
+
+    Повторяющиеся одинаковые SQL-запросы в одном запросе (N+1)
+    записываются в лог.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Так Django 3.2 распознает экземпляр как асинхронный и не
+            # переводит цепочку в общий thread-sensitive поток.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = _local.metrics = RequestMetrics()
+        started = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _local.metrics = None
+        return self.observe(request, response, metrics, started)
+
+    async def __acall__(self, request):
+        metrics = _local.metrics = RequestMetrics()
+        started = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _local.metrics = None
+        return self.observe(request, response, metrics, started)
+
+    def observe(self, request, response, metrics, started):
+        latency = perf_counter() - started
+        endpoint = endpoint_name(request)
+        registry.observe(
+            endpoint,
+            latency=latency,
+            queries=sum(metrics.queries.values()),
+            db_time=metrics.db_time,
+            serializer_time=metrics.serializer_time,
+            response_bytes=(0 if response.streaming
+                            else len(response.content))
+        )
+        for sql, count in metrics.queries.most_common():
+            if count < settings.METRICS_N_PLUS_ONE_THRESHOLD:
+                break
+            logger.warning('Возможный N+1 в %s: %d одинаковых запросов: %s',
+                           endpoint, count, sql)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics_view = view_func
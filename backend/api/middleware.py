@@ -0,0 +1,86 @@
+import asyncio
+
+from django.conf import settings
+from django.contrib.auth import middleware as auth
+from django.contrib.messages import middleware as messages
+from django.contrib.sessions import middleware as sessions
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.routers import read_from
+
+
+class SkipForAPIMixin:
+    """Пропускает middleware для путей из LEAN_MIDDLEWARE_PATHS.
+
+    API аутентифицируется токеном в DRF, поэтому сессии, пользователь
+    из сессии и сообщения нужны только админке и входу через браузер.
+    """
+
+    def __call__(self, request):
+        if request.path_info.startswith(settings.LEAN_MIDDLEWARE_PATHS):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class SessionMiddleware(SkipForAPIMixin, sessions.SessionMiddleware):
+    pass
+
+
+class AuthenticationMiddleware(SkipForAPIMixin,
+                               auth.AuthenticationMiddleware):
+    pass
+
+
+class MessageMiddleware(SkipForAPIMixin, messages.MessageMiddleware):
+    pass
+
+
+class ReplicaMiddleware:
+    """Отправляет чтения безопасных запросов к API в реплику.
+
+    Клиент, выполнивший успешный изменяющий запрос, получает cookie
+    DB_REPLICA_PIN_COOKIE и на DB_REPLICA_PIN_SECONDS закрепляется за
+    основной базой, поэтому сразу видит свои изменения, даже если
+    реплика отстает. Метка хранится у клиента, а не в кэше воркера, и
+    действует в любом воркере.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if self.use_replica(request):
+            with read_from(settings.DB_REPLICA):
+                return self.get_response(request)
+        return self.pin(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        if self.use_replica(request):
+            with read_from(settings.DB_REPLICA):
+                return await self.get_response(request)
+        return self.pin(request, await self.get_response(request))
+
+    @staticmethod
+    def use_replica(request):
+        return (request.method in SAFE_METHODS
+                and request.path_info.startswith(settings.DB_REPLICA_PATHS)
+                and settings.DB_REPLICA_PIN_COOKIE not in request.COOKIES)
+
+    @staticmethod
+    def pin(request, response):
+        if (request.method not in SAFE_METHODS
+                and response.status_code < 400):
+            response.set_cookie(
+                settings.DB_REPLICA_PIN_COOKIE, '1',
+                max_age=settings.DB_REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax'
+            )
+        return response
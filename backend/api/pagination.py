@@ -0,0 +1,120 @@
+import json
+from base64 import b64decode, b64encode
+from binascii import Error as BinasciiError
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class FeedPagination(PageNumberPagination):
+    """Постраничная пагинация с режимом курсора (keyset).
+
+    По умолчанию работает как PageNumberPagination. Если в запросе есть
+    параметр cursor (для первой страницы - пустой), страница выбирается
+    условием по полям cursor_ordering после последней записи предыдущей
+    страницы, без OFFSET и без COUNT(*). Общее число записей
+    возвращается только при count=true.
+    """
+
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    cursor_ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Неверный курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = (
+            self.cursor_query_param in request.query_params
+            and isinstance(queryset, QuerySet)
+        )
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'true':
+            self.count = queryset.count()
+        position = self.decode_cursor(request, queryset.model)
+        queryset = queryset.order_by(*self.cursor_ordering)
+        if position is not None:
+            queryset = queryset.filter(self.after(position))
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page_results = results[:self.page_size]
+        return self.page_results
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        response = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            response = {'count': self.count, **response}
+        return Response(response)
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        last = self.page_results[-1]
+        position = [
+            getattr(last, field.lstrip('-')) for field in self.cursor_ordering
+        ]
+        cursor = b64encode(
+            json.dumps(position, default=lambda value: value.isoformat())
+            .encode()
+        ).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_previous_link(self):
+        if not self.use_cursor:
+            return super().get_previous_link()
+        return None
+
+    def decode_cursor(self, request, model):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            position = json.loads(b64decode(cursor.encode()).decode())
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.cursor_ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [
+                self.cursor_value(model, field.lstrip('-'), value)
+                for field, value in zip(self.cursor_ordering, position)
+            ]
+        except (TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def cursor_value(model, name, value):
+        """Приводит значение из курсора к типу поля модели."""
+        if (isinstance(value, bool) or not isinstance(value, (str, int))
+                or isinstance(value, int) and abs(value) >= 2 ** 63):
+            raise TypeError(f'Недопустимое значение курсора: {value!r}')
+        return model._meta.get_field(name).clean(value, None)
+
+    def after(self, position):
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.cursor_ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+
+class SubscriptionPagination(FeedPagination):
+    cursor_ordering = ('-id',)
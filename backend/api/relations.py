@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+
+from foodgram.routers import use_primary
+from recipes.cache import bump_version, get_version
+from recipes.models import Favorite, ShoppingCart
+from users.models import Subscription
+
+
+class UserRelations:
+    """Избранное, корзина и подписки пользователя на время запроса.
+
+    Каждое множество загружается одним запросом при первом обращении;
+    если USER_RELATIONS_CACHE_TIMEOUT больше нуля (только с общим
+    кэшем), множества хранятся в кэше под версией, которую views
+    увеличивают при изменениях.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    @classmethod
+    def for_request(cls, request):
+        if request is None:
+            return cls(None)
+        relations = getattr(request, '_user_relations', None)
+        if relations is None:
+            relations = request._user_relations = cls(request.user)
+        return relations
+
+    @staticmethod
+    def changed(model, user):
+        bump_version(model, user.pk)
+
+    def load(self, model, field):
+        if self.user is None or not self.user.is_authenticated:
+            return frozenset()
+        timeout = settings.USER_RELATIONS_CACHE_TIMEOUT
+        if timeout:
+            key = (f'relations:{model._meta.label_lower}:{self.user.pk}:'
+                   f'{get_version(model, self.user.pk)}')
+            ids = cache.get(key)
+            if ids is not None:
+                return ids
+        with use_primary():
+            ids = frozenset(model.objects.filter(
+                user=self.user).values_list(field, flat=True))
+        if timeout:
+            cache.set(key, ids, timeout)
+        return ids
+
+    @cached_property
+    def favorite_ids(self):
+        return self.load(Favorite, 'recipe_id')
+
+    @cached_property
+    def shopping_cart_ids(self):
+        return self.load(ShoppingCart, 'recipe_id')
+
+    @cached_property
+    def subscribed_author_ids(self):
+        return self.load(Subscription, 'author_id')
@@ -0,0 +1,75 @@
+from api.relations import UserRelations
+
+
+def file_url(value, request):
+    if not value:
+        return None
+    try:
+        url = value.url
+    except AttributeError:
+        return None
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def tag_data(tag):
+    return {
+        'id': tag.id,
+        'name': tag.name,
+        'color': tag.color,
+        'slug': tag.slug,
+    }
+
+
+def user_data(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'last_name': user.last_name,
+        'first_name': user.first_name,
+        'email': user.email,
+    }
+
+
+def recipe_ingredient_data(recipe_ingredient):
+    ingredient = recipe_ingredient.ingredient
+    return {
+        'id': ingredient.id,
+        'amount': recipe_ingredient.amount,
+        'name': ingredient.name,
+        'measurement_unit': ingredient.measurement_unit,
+    }
+
+
+def recipe_data(recipe, request):
+    relations = UserRelations.for_request(request)
+    return {
+        'id': recipe.id,
+        'tags': [tag_data(tag) for tag in recipe.tags.all()],
+        'ingredients': [
+            recipe_ingredient_data(recipe_ingredient)
+            for recipe_ingredient in recipe.recipe_ingredients.all()
+        ],
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image': file_url(recipe.image, request),
+        'image_thumbnail': file_url(recipe.image_thumbnail, request),
+        'image_medium': file_url(recipe.image_medium, request),
+        'image_webp': file_url(recipe.image_webp, request),
+        'is_in_shopping_cart': recipe.id in relations.shopping_cart_ids,
+        'is_favorited': recipe.id in relations.favorite_ids,
+        'author': user_data(recipe.author),
+    }
+
+
+def recipe_info_data(recipe, request):
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'cooking_time': recipe.cooking_time,
+        'image': file_url(recipe.image, request),
+        'image_thumbnail': file_url(recipe.image_thumbnail, request),
+        'image_webp': file_url(recipe.image_webp, request),
+    }
@@ -1,18 +1,20 @@
 from django.contrib.auth import get_user_model
+from django.db.models import prefetch_related_objects
 from django.db.transaction import atomic
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
-from rest_framework.relations import PrimaryKeyRelatedField
 
-from recipes.models import (Favorite,
-                            Ingredient,
+from api.fields import StagedImageField
+from api.relations import UserRelations
+from api.representations import recipe_data, recipe_info_data
+from recipes import shopping_list
+from recipes.images import schedule_processing, stage_image
+from recipes.models import (Ingredient,
                             Recipe,
                             RecipeIngredient,
-                            ShoppingCart,
+                            ShoppingListItem,
                             Tag)
-from users.models import Subscription
 
 User = get_user_model()
 
@@ -58,8 +60,22 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
                   'measurement_unit')
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(source='ingredient.id')
+    name = serializers.CharField(source='ingredient.name')
+    measurement_unit = serializers.CharField(
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id',
+                  'name',
+                  'measurement_unit',
+                  'total_amount')
+
+
 class CreateRecipeIngredientSerializer(serializers.ModelSerializer):
-    id = PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
 
     class Meta:
         model = RecipeIngredient
@@ -72,8 +88,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         many=True,
         source='recipe_ingredients'
     )
-    is_in_shopping_cart = serializers.SerializerMethodField()
-    is_favorited = serializers.SerializerMethodField()
+    is_in_shopping_cart = serializers.BooleanField(read_only=True)
+    is_favorited = serializers.BooleanField(read_only=True)
     author = CustomUserSerializer()
 
     class Meta:
@@ -85,31 +101,15 @@ class RecipeSerializer(serializers.ModelSerializer):
                   'text',
                   'cooking_time',
                   'image',
+                  'image_thumbnail',
+                  'image_medium',
+                  'image_webp',
                   'is_in_shopping_cart',
                   'is_favorited',
                   'author')
 
-    def get_is_in_shopping_cart(self, obj):
-        try:
-            user = self.context['request'].user
-        except KeyError:
-            return False
-        if user.is_authenticated:
-            return ShoppingCart.objects.filter(
-                recipe=obj, user=user
-            ).exists()
-        return False
-
-    def get_is_favorited(self, obj):
-        try:
-            user = self.context['request'].user
-        except KeyError:
-            return False
-        if user.is_authenticated:
-            return Favorite.objects.filter(
-                recipe=obj, user=user
-            ).exists()
-        return False
+    def to_representation(self, instance):
+        return recipe_data(instance, self.context.get('request'))
 
 
 class CreateRecipeSerializer(serializers.ModelSerializer):
@@ -117,7 +117,7 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         many=True,
         source='recipe_ingredients'
     )
-    image = Base64ImageField()
+    image = StagedImageField()
 
     class Meta:
         model = Recipe
@@ -139,43 +139,101 @@ class CreateRecipeSerializer(serializers.ModelSerializer):
         if len(tags) != len(set(tags)):
             raise ValidationError('В тэгах есть дубликаты.')
         ingredient_ids = set(
-            ingredient['id'].id for ingredient in ingredients
+            ingredient['id'] for ingredient in ingredients
         )
         if len(ingredients) != len(ingredient_ids):
             raise ValidationError('В ингредиентах есть дубликаты.')
+        existing_ids = set(Ingredient.objects.filter(
+            id__in=ingredient_ids
+        ).values_list('id', flat=True))
+        if existing_ids != ingredient_ids:
+            raise ValidationError(
+                f'Ингредиенты не найдены: '
+                f'{sorted(ingredient_ids - existing_ids)}.'
+            )
         return data
 
     @atomic()
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('recipe_ingredients')
-        recipe = Recipe.objects.create(**validated_data)
+        image = validated_data.pop('image')
+        recipe = Recipe.objects.create(
+            image_staged=stage_image(image), **validated_data)
         recipe.tags.set(tags)
         self.create_ingredients(recipe, ingredients)
+        schedule_processing(recipe.id, recipe.image_staged)
         return recipe
 
     @atomic()
     def update(self, recipe, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('recipe_ingredients')
-        recipe.ingredients.clear()
+        image = validated_data.pop('image', None)
+        if image:
+            validated_data['image_staged'] = stage_image(image)
+            schedule_processing(recipe.id, validated_data['image_staged'])
         recipe.tags.set(tags)
-        self.create_ingredients(recipe, ingredients)
+        self.update_ingredients(recipe, ingredients)
         return super().update(recipe, validated_data)
 
     @staticmethod
     def create_ingredients(recipe, ingredients):
-        for ingredient in ingredients:
-            cur_ingredient = Ingredient.objects.get(
-                id=ingredient['id'].id)
-            RecipeIngredient.objects.create(
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
                 recipe=recipe,
-                ingredient=cur_ingredient,
+                ingredient_id=ingredient['id'],
                 amount=ingredient['amount']
             )
+            for ingredient in ingredients
+        ])
+
+    @classmethod
+    def update_ingredients(cls, recipe, ingredients):
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipe_ingredients.all()
+        }
+        new_amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        deltas = {
+            ingredient_id: new_amounts.get(ingredient_id, 0) - (
+                current[ingredient_id].amount
+                if ingredient_id in current else 0)
+            for ingredient_id in current.keys() | new_amounts.keys()
+        }
+        shopping_list.change_recipe_ingredients(recipe.pk, deltas)
+        removed_ids = current.keys() - new_amounts.keys()
+        if removed_ids:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed_ids
+            ).delete()
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            recipe_ingredient = current.get(ingredient_id)
+            if recipe_ingredient and recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        cls.create_ingredients(recipe, [
+            ingredient for ingredient in ingredients
+            if ingredient['id'] not in current
+        ])
 
     def to_representation(self, instance):
-        return RecipeSerializer(instance).data
+        # Изображение могло быть обработано сразу после коммита, а пока
+        # оно ждет обработки, в ответе остается прежнее (или null) и
+        # image_processing: true.
+        instance.refresh_from_db(fields=[
+            'image', 'image_thumbnail', 'image_medium', 'image_webp',
+            'image_staged'])
+        prefetch_related_objects(
+            [instance], 'tags', 'recipe_ingredients__ingredient')
+        data = RecipeSerializer(instance).data
+        data['image_processing'] = bool(instance.image_staged)
+        return data
 
 
 class CustomUserCreateSerializer(UserCreateSerializer):
@@ -197,11 +255,24 @@ class RecipeInfoSerializer(serializers.ModelSerializer):
         fields = ('id',
                   'name',
                   'cooking_time',
-                  'image')
+                  'image',
+                  'image_thumbnail',
+                  'image_webp')
+
+    def to_representation(self, instance):
+        return recipe_info_data(instance, self.context.get('request'))
+
+
+class BatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1, max_value=2 ** 63 - 1),
+        allow_empty=False,
+        max_length=100
+    )
 
 
 class SubscriptionSerializer(serializers.ModelSerializer):
-    recipes = RecipeInfoSerializer(many=True)
+    recipes = RecipeInfoSerializer(many=True, source='limited_recipes')
     is_subscribed = serializers.SerializerMethodField()
 
     class Meta:
@@ -212,12 +283,9 @@ class SubscriptionSerializer(serializers.ModelSerializer):
                   'username',
                   'id',
                   'is_subscribed',
-                  'recipes')
+                  'recipes',
+                  'recipes_count')
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        return (user.is_authenticated and Subscription.objects.filter(
-            user=user,
-            author=obj
-        ).exists()
-        )
+        relations = UserRelations.for_request(self.context.get('request'))
+        return obj.id in relations.subscribed_author_ids
@@ -0,0 +1,71 @@
+import csv
+import io
+from pathlib import Path
+
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+PDF_FONT = 'DejaVuSans'
+PDF_FONT_PATH = Path(__file__).resolve().parent / 'fonts' / 'DejaVuSans.ttf'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_LINE_HEIGHT = 20
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def format_line(ingredient):
+    return (
+        f"{ingredient['ingredient__name']}"
+        f"({ingredient['ingredient__measurement_unit']})"
+        f" - {ingredient['total_amount']}"
+    )
+
+
+def render_txt(ingredients):
+    for ingredient in ingredients:
+        yield f'{format_line(ingredient)}\n'
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['ingredient__name'],
+            ingredient['ingredient__measurement_unit'],
+            ingredient['total_amount']
+        ))
+
+
+def render_pdf(ingredients):
+    """Список покупок в PDF. Шрифт DejaVuSans лежит рядом с модулем:
+    встроенные шрифты PDF не содержат кириллицы."""
+    if PDF_FONT not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(PDF_FONT, str(PDF_FONT_PATH)))
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    _, height = A4
+    y = height - PDF_MARGIN
+    pdf.setFont(PDF_FONT, PDF_FONT_SIZE)
+    for ingredient in ingredients:
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(PDF_FONT, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        pdf.drawString(PDF_MARGIN, y, format_line(ingredient))
+        y -= PDF_LINE_HEIGHT
+    pdf.save()
+    yield buffer.getvalue()
+
+
+SHOPPING_CART_FORMATS = {
+    'txt': ('text/plain; charset=utf-8', render_txt),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'pdf': ('application/pdf', render_pdf),
+}
@@ -0,0 +1,30 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_out
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import revoke_user_tokens, token_cache_key
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def revoke_deleted_token(instance, **kwargs):
+    key = token_cache_key(instance.key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+@receiver(user_logged_out)
+def revoke_logged_out_user(user=None, **kwargs):
+    if user is not None:
+        transaction.on_commit(lambda: revoke_user_tokens(user.pk))
+
+
+@receiver(post_save, sender=User)
+def revoke_changed_user(instance, raw=False, update_fields=None, **kwargs):
+    if raw or update_fields == frozenset(['last_login']):
+        return
+    transaction.on_commit(lambda: revoke_user_tokens(instance.pk))
@@ -0,0 +1,449 @@
+import asyncio
+import base64
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import DatabaseError, connections, transaction
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+
+from foodgram.routers import PrimaryReplicaRouter
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.pantry import pantry_index
+from users.models import User
+
+from .cache import recipe_cache_key
+from .middleware import ReplicaMiddleware
+from .renderers import FastJSONRenderer
+from .serializers import RecipeInfoSerializer, RecipeSerializer
+
+HAS_REPLICA = settings.DB_REPLICA in settings.DATABASES
+
+
+class RecipeTestData:
+    """Пользователь с токеном, теги, ингредиенты и рецепты автора.
+
+    Если настроена реплика, в тестах она зеркалирует основную базу;
+    чтобы она видела данные транзакции теста, на время теста ее
+    псевдоним указывает на соединение основной базы.
+    """
+
+    recipes_count = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Иван', last_name='Иванов', password='pass12345'
+        )
+        cls.author = User.objects.create_user(
+            username='cook', email='cook@example.com',
+            first_name='Анна', last_name='Петрова', password='pass12345'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.tags = [
+            Tag.objects.create(name='Завтрак', color='#E26C2D',
+                               slug='breakfast'),
+            Tag.objects.create(name='Обед', color='#49B64E', slug='lunch'),
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name, unit in (('соль', 'г'), ('молоко', 'мл'),
+                               ('яйца', 'шт'))
+        ]
+        cls.recipes = []
+        for number in range(cls.recipes_count):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Каша {number}', text='Сварить.',
+                cooking_time=10 + number, image=f'images/kasha{number}.png'
+            )
+            recipe.tags.set(cls.tags)
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=amount)
+                for amount, ingredient in enumerate(cls.ingredients, 1)
+            ])
+            cls.recipes.append(recipe)
+        cls.recipe = cls.recipes[0]
+
+    def setUp(self):
+        cache.clear()
+        if HAS_REPLICA:
+            replica = connections[settings.DB_REPLICA]
+            connections[settings.DB_REPLICA] = connections['default']
+            self.addCleanup(
+                connections.__setitem__, settings.DB_REPLICA, replica)
+
+    def authorize(self):
+        self.client.defaults.update(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+class RecipeListQueriesTests(RecipeTestData, TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    recipes_count = 6
+
+    def assertListQueries(self, number, path):
+        for limit in (1, self.recipes_count):
+            cache.clear()
+            with self.subTest(limit=limit), self.assertNumQueries(number):
+                response = self.client.get(f'{path}limit={limit}')
+                self.assertEqual(len(response.json()['results']), limit)
+
+    def test_anonymous_list(self):
+        self.assertListQueries(4, '/api/recipes/?')
+
+    def test_authenticated_list(self):
+        self.authorize()
+        self.assertListQueries(7, '/api/recipes/?')
+
+    def test_authenticated_filtered_list(self):
+        self.authorize()
+        Favorite.objects.bulk_create([
+            Favorite(user=self.user, recipe=recipe)
+            for recipe in self.recipes
+        ])
+        self.assertListQueries(
+            8, '/api/recipes/?is_favorited=1&tags=breakfast&')
+
+    def test_cursor_list(self):
+        self.assertListQueries(3, '/api/recipes/?cursor=&')
+
+    def test_ordering_by_counter_is_stable(self):
+        with CaptureQueriesContext(connections['default']) as queries:
+            self.client.get('/api/recipes/?ordering=-favorites_count')
+        self.assertTrue(any(
+            'ORDER BY "recipes_recipe"."favorites_count" DESC, '
+            '"recipes_recipe"."pub_date" DESC, "recipes_recipe"."id" DESC'
+            in query['sql'] for query in queries.captured_queries
+        ))
+
+
+class FastRepresentationTests(RecipeTestData, TestCase):
+    """Быстрое представление рецептов и FastJSONRenderer дают те же
+    байты, что поля DRF и стандартный JSONRenderer."""
+
+    recipes_count = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Recipe.objects.filter(pk=cls.recipe.pk).update(
+            name='Суп "Тест" \\ \U0001F372',
+            text='Строка\u2028абзац\u2029\x01\t<b>&</b>',
+            image_thumbnail='images/variants/kasha0_thumb.jpg',
+            image_medium='images/variants/kasha0_medium.jpg',
+            image_webp='images/variants/kasha0.webp',
+        )
+        Recipe.objects.filter(pk=cls.recipes[1].pk).update(image='')
+        Favorite.objects.create(user=cls.user, recipe=cls.recipe)
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[2])
+
+    def setUp(self):
+        super().setUp()
+        self.request = RequestFactory().get('/api/recipes/')
+        self.request.user = self.user
+        self.queryset = Recipe.objects.select_related(
+            'author').prefetch_related(
+            'tags', 'recipe_ingredients__ingredient').order_by('id')
+
+    def assertSameBytes(self, serializer_class):
+        recipes = list(self.queryset)
+        context = {'request': self.request}
+        fast = FastJSONRenderer().render(
+            serializer_class(recipes, many=True, context=context).data)
+        data = []
+        for recipe in recipes:
+            recipe.is_favorited = Favorite.objects.filter(
+                user=self.user, recipe=recipe).exists()
+            recipe.is_in_shopping_cart = ShoppingCart.objects.filter(
+                user=self.user, recipe=recipe).exists()
+            data.append(serializers.ModelSerializer.to_representation(
+                serializer_class(recipe, context=context), recipe))
+        self.assertEqual(fast, JSONRenderer().render(data))
+
+    def test_recipe(self):
+        self.assertSameBytes(RecipeSerializer)
+
+    def test_recipe_info(self):
+        self.assertSameBytes(RecipeInfoSerializer)
+
+    def test_integer_beyond_64_bits(self):
+        data = {'id': 2 ** 70, 'name': 'Строка\u2028'}
+        self.assertEqual(FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+
+
+class BatchRelationTests(RecipeTestData, TestCase):
+    """Пакетное добавление и удаление избранного."""
+
+    def setUp(self):
+        super().setUp()
+        self.authorize()
+
+    def test_batch_favorite(self):
+        response = self.client.post(
+            '/api/recipes/favorite/', {'ids': [self.recipe.id, 10 ** 6]},
+            content_type='application/json')
+        self.assertEqual(response.json()['results'], [
+            {'id': self.recipe.id, 'status': 'added'},
+            {'id': 10 ** 6, 'status': 'not_found'},
+        ])
+        self.assertTrue(Favorite.objects.filter(
+            user=self.user, recipe=self.recipe).exists())
+
+    def test_out_of_range_id_is_rejected(self):
+        response = self.client.post(
+            '/api/recipes/favorite/', {'ids': [2 ** 63]},
+            content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeDetailCacheTests(RecipeTestData, TestCase):
+    """Общий для всех пользователей кэш рецепта без их отметок."""
+
+    def test_cached_recipe_has_no_user_flags(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        self.authorize()
+        path = f'/api/recipes/{self.recipe.id}/'
+        self.assertTrue(self.client.get(path).json()['is_favorited'])
+        key = recipe_cache_key(RequestFactory().get(path), self.recipe.id)
+        self.assertFalse(cache.get(key)['is_favorited'])
+        self.client.defaults.pop('HTTP_AUTHORIZATION')
+        self.assertFalse(self.client.get(path).json()['is_favorited'])
+
+
+class ShoppingCartDownloadTests(RecipeTestData, TestCase):
+    """Выгрузка списка покупок в разных форматах."""
+
+    def setUp(self):
+        super().setUp()
+        self.authorize()
+        self.client.post(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+
+    def download(self, file_type):
+        response = self.client.get('/api/recipes/download_shopping_cart/',
+                                   {'type': file_type})
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_txt(self):
+        _, content = self.download('txt')
+        self.assertIn('молоко(мл) - 2', content.decode())
+
+    def test_pdf(self):
+        response, content = self.download('pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('shopping_cart.pdf', response['Content-Disposition'])
+        self.assertTrue(content.startswith(b'%PDF'))
+
+
+@override_settings(INGREDIENT_SEARCH_LIMIT=2)
+class IngredientSearchTests(RecipeTestData, TestCase):
+    """Поиск ингредиентов: сначала по началу названия, не больше
+    INGREDIENT_SEARCH_LIMIT строк."""
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        return [ingredient['name'] for ingredient in response.json()]
+
+    def test_prefix_matches_first(self):
+        Ingredient.objects.create(name='кокосовое молоко',
+                                  measurement_unit='мл')
+        self.assertEqual(self.search('мол'),
+                         ['молоко', 'кокосовое молоко'])
+
+    def test_results_are_limited(self):
+        for name in ('сода', 'соевый соус', 'сок'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+        self.assertEqual(self.search('со'), ['сода', 'соевый соус'])
+
+
+def image_data(color):
+    content = BytesIO()
+    Image.new('RGB', (40, 40), color).save(content, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(content.getvalue()).decode())
+
+
+class RecipeIndexUpdateTests(RecipeTestData, TestCase):
+    """Обновление индексов рецептов после фиксации транзакции."""
+
+    recipes_count = 2
+
+    def test_rolled_back_delete_keeps_recipe(self):
+        with self.assertRaises(DatabaseError):
+            with transaction.atomic():
+                self.recipe.delete()
+                raise DatabaseError
+        with mock.patch.object(pantry_index, 'remove_recipe') as remove, \
+                self.captureOnCommitCallbacks(execute=True):
+            self.recipes[1].save()
+        remove.assert_not_called()
+
+    def test_update_survives_savepoint_rollback(self):
+        with mock.patch.object(pantry_index, 'refresh_recipe') as refresh, \
+                self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(DatabaseError):
+                with transaction.atomic():
+                    self.recipe.save()
+                    raise DatabaseError
+            self.recipes[1].save()
+        self.assertEqual(
+            {call.args[0] for call in refresh.call_args_list},
+            {self.recipe.id, self.recipes[1].id})
+
+
+@override_settings(IMAGE_WORKERS=0)
+class RecipeImageTests(RecipeTestData, TestCase):
+    """Обработка загруженного изображения после коммита."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.media_root = tempfile.mkdtemp()
+        cls.media = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media.disable()
+        shutil.rmtree(cls.media_root)
+
+    def save(self, method, path, color):
+        token, _ = Token.objects.get_or_create(user=self.author)
+        self.client.defaults.update(HTTP_AUTHORIZATION=f'Token {token.key}')
+        with self.captureOnCommitCallbacks(execute=True):
+            response = getattr(self.client, method)(path, {
+                'tags': [tag.id for tag in self.tags],
+                'ingredients': [{'id': self.ingredients[0].id,
+                                 'amount': 5}],
+                'name': 'Омлет', 'text': 'Взбить.', 'cooking_time': 5,
+                'image': image_data(color),
+            }, content_type='application/json')
+        self.assertIn(response.status_code, (200, 201))
+        return response.json()
+
+    @staticmethod
+    def image_names(recipe_id):
+        return Recipe.objects.values_list(
+            'image', 'image_thumbnail', 'image_medium', 'image_webp'
+        ).get(pk=recipe_id)
+
+    def test_image_is_processed_after_commit(self):
+        data = self.save('post', '/api/recipes/', 'red')
+        self.assertTrue(data['image_processing'])
+        self.assertIsNone(data['image'])
+        for name in self.image_names(data['id']):
+            self.assertTrue(default_storage.exists(name))
+
+    def test_replaced_image_files_are_deleted(self):
+        recipe_id = self.save('post', '/api/recipes/', 'red')['id']
+        previous = self.image_names(recipe_id)
+        self.save('patch', f'/api/recipes/{recipe_id}/', 'blue')
+        for name in previous:
+            self.assertFalse(default_storage.exists(name))
+        for name in self.image_names(recipe_id):
+            self.assertTrue(default_storage.exists(name))
+
+
+class ReplicaMiddlewareTests(SimpleTestCase):
+    """Выбор базы для чтения и закрепление клиента за основной базой."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.read_databases = []
+
+    def view(self, request):
+        self.read_databases.append(PrimaryReplicaRouter().db_for_read(None))
+        return HttpResponse(status=getattr(request, 'status', 200))
+
+    async def async_view(self, request):
+        return self.view(request)
+
+    def test_safe_api_request_reads_from_replica(self):
+        ReplicaMiddleware(self.view)(self.factory.get('/api/recipes/'))
+        self.assertEqual(self.read_databases, [settings.DB_REPLICA])
+
+    def test_other_paths_read_from_primary(self):
+        ReplicaMiddleware(self.view)(self.factory.get('/admin/'))
+        self.assertEqual(self.read_databases, ['default'])
+
+    def test_successful_write_pins_client(self):
+        middleware = ReplicaMiddleware(self.view)
+        response = middleware(self.factory.post('/api/recipes/1/favorite/'))
+        self.assertEqual(self.read_databases, ['default'])
+        cookie = response.cookies[settings.DB_REPLICA_PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.DB_REPLICA_PIN_SECONDS)
+        request = self.factory.get('/api/recipes/')
+        request.COOKIES[settings.DB_REPLICA_PIN_COOKIE] = cookie.value
+        middleware(request)
+        self.assertEqual(self.read_databases, ['default', 'default'])
+
+    def test_failed_write_does_not_pin_client(self):
+        request = self.factory.post('/api/recipes/1/favorite/')
+        request.status = 400
+        response = ReplicaMiddleware(self.view)(request)
+        self.assertNotIn(settings.DB_REPLICA_PIN_COOKIE, response.cookies)
+
+    def test_async_chain_stays_async(self):
+        middleware = ReplicaMiddleware(self.async_view)
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        response = asyncio.run(
+            middleware(self.factory.post('/api/recipes/1/favorite/')))
+        request = self.factory.get('/api/recipes/')
+        asyncio.run(middleware(request))
+        request.COOKIES.update(
+            {key: morsel.value for key, morsel in response.cookies.items()})
+        asyncio.run(middleware(request))
+        self.assertEqual(self.read_databases,
+                         ['default', settings.DB_REPLICA, 'default'])
+
+
+@skipUnless(HAS_REPLICA, 'Реплика не настроена (DB_REPLICA_HOST).')
+class ReplicaRoutingTests(RecipeTestData, TestCase):
+    """Запросы к API с настроенной репликой: выбор базы для чтения
+    записывается роутером."""
+
+    def setUp(self):
+        super().setUp()
+        self.authorize()
+
+    def get(self, path):
+        databases = []
+        db_for_read = PrimaryReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            databases.append(db_for_read(router, model, **hints))
+            return databases[-1]
+
+        with mock.patch.object(PrimaryReplicaRouter, 'db_for_read', record):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, set(databases)
+
+    def test_reads_go_to_replica(self):
+        _, databases = self.get('/api/recipes/')
+        self.assertIn(settings.DB_REPLICA, databases)
+
+    def test_client_reads_own_writes_from_primary(self):
+        response = self.client.post(
+            f'/api/recipes/{self.recipe.id}/favorite/')
+        self.assertEqual(response.status_code, 201)
+        response, databases = self.get('/api/recipes/?is_favorited=1')
+        self.assertNotIn(settings.DB_REPLICA, databases)
+        self.assertEqual(response.json()['results'][0]['id'], self.recipe.id)
@@ -1,12 +1,15 @@
 from rest_framework.routers import DefaultRouter
 
+from django.conf import settings
 from django.urls import include, path
 
+from .async_views import offload
 from .views import (
     IngredientViewSet,
     RecipeViewSet,
     TagViewSet,
-    CustomUserViewSet
+    CustomUserViewSet,
+    metrics
 )
 
 router = DefaultRouter()
@@ -15,7 +18,22 @@ router.register('ingredients', IngredientViewSet)
 router.register('recipes', RecipeViewSet)
 router.register('users', CustomUserViewSet)
 
+ASYNC_VIEW_NAMES = (
+    'tag-list',
+    'ingredient-list',
+    'recipe-list',
+    'recipe-detail',
+    'recipe-download-shopping-cart',
+)
+
+router_urls = router.urls
+if settings.ASYNC_VIEWS:
+    for pattern in router_urls:
+        if pattern.name in ASYNC_VIEW_NAMES:
+            pattern.callback = offload(pattern.callback)
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('_metrics', metrics, name='metrics'),
+    path('', include(router_urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
@@ -1,57 +1,188 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import IntegrityError, connection
+from django.db.models import (Exists,
+                              F,
+                              OuterRef,
+                              Prefetch,
+                              prefetch_related_objects,
+                              Window)
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import RowNumber
+from django.db.transaction import atomic
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from api.filters import RecipeFilter
+from api.cache import ReferenceCacheMixin, recipe_cache_key
+from api.filters import IngredientFilter, RecipeFilter, StableOrderingFilter
+from api.metrics import registry, render_prometheus
+from api.pagination import FeedPagination, SubscriptionPagination
 from api.permissions import IsAuthor
+from api.relations import UserRelations
 from api.serializers import (
+    BatchSerializer,
     CreateRecipeSerializer,
     IngredientSerializer,
     RecipeInfoSerializer,
     RecipeSerializer,
+    ShoppingListItemSerializer,
     SubscriptionSerializer,
     TagSerializer
 )
+from api.shopping_cart import SHOPPING_CART_FORMATS
 from recipes.models import (
     Favorite,
     Ingredient,
     Recipe,
     RecipeIngredient,
     ShoppingCart,
+    ShoppingListItem,
     Tag
 )
+from foodgram.routers import use_primary
+from recipes import shopping_list
+from recipes.counters import count_subquery, decrement
+from recipes.pantry import pantry_index
+from recipes.search import ingredient_index
 from users.models import Subscription
 
 User = get_user_model()
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+def metrics(request):
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    return HttpResponse(
+        render_prometheus(registry.collect(),
+                          registry.collect_connections()),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
+
+
+def lock_relations(user):
+    """Изменения связей пользователя выполняются по очереди до конца
+    транзакции.
+
+    Без этого параллельный запрос может добавить или удалить ту же
+    связь между проверкой и изменением, и одно изменение списка
+    покупок будет применено дважды. Блокировка строки пользователя не
+    подходит: она взаимно блокировалась бы с обновлением счетчика
+    подписчиков, поэтому берется транзакционная advisory-блокировка.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [user.pk])
+
+
+def apply_batch(request, model, field, queryset, add, errors=None):
+    """Добавляет или удаляет связи пользователя с объектами из
+    request.data['ids'] одним bulk_create или DELETE ... IN.
+
+    Вызывается в транзакции: связи читаются под lock_relations(),
+    поэтому возвращаемые id измененных объектов совпадают с
+    действительно вставленными или удаленными строками. Возвращает их
+    и статус каждого id.
+    """
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    statuses = dict(errors or {})
+    lock_relations(request.user)
+    related = dict(queryset.filter(pk__in=ids).annotate(
+        related=Exists(model.objects.filter(
+            user=request.user, **{field: OuterRef('pk')}))
+    ).values_list('pk', 'related'))
+    changed = []
+    for pk in ids:
+        if pk in statuses:
+            continue
+        if pk not in related:
+            statuses[pk] = 'not_found'
+        elif related[pk] == add:
+            statuses[pk] = 'already_added' if add else 'not_added'
+        else:
+            statuses[pk] = 'added' if add else 'removed'
+            changed.append(pk)
+    if changed:
+        if add:
+            model.objects.bulk_create([
+                model(user=request.user, **{f'{field}_id': pk})
+                for pk in changed
+            ], ignore_conflicts=True)
+        else:
+            model.objects.filter(
+                user=request.user, **{f'{field}_id__in': changed}
+            ).delete()
+    return changed, [{'id': pk, 'status': statuses[pk]} for pk in ids]
+
+
+class TagViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
+    filterset_class = IngredientFilter
+
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name and connection.vendor != 'postgresql':
+            return Response(ingredient_index.search(
+                name, settings.INGREDIENT_SEARCH_LIMIT))
+        return super().list(request, *args, **kwargs)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
-    pagination_class = PageNumberPagination
+    pagination_class = FeedPagination
     permission_classes = (permissions.IsAuthenticatedOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
-    ordering = ('-pub_date',)
+    filter_backends = (StableOrderingFilter, DjangoFilterBackend)
+    ordering = ('-pub_date', '-id')
+    ordering_fields = ('pub_date', 'favorites_count', 'in_carts_count')
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        return Recipe.objects.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            )
+        ).order_by(*self.ordering)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            pk = int(kwargs[self.lookup_field])
+        except ValueError:
+            return super().retrieve(request, *args, **kwargs)
+        key = recipe_cache_key(request, pk)
+        data = cache.get(key)
+        if data is None:
+            with use_primary():
+                data = super().retrieve(request, *args, **kwargs).data
+            cache.set(key, {**data, 'is_favorited': False,
+                            'is_in_shopping_cart': False},
+                      settings.REFERENCE_CACHE_TIMEOUT)
+            return Response(data)
+        relations = UserRelations.for_request(request)
+        data['is_favorited'] = pk in relations.favorite_ids
+        data['is_in_shopping_cart'] = pk in relations.shopping_cart_ids
+        return Response(data)
+
     def get_serializer_class(self):
         if self.action in ['create', 'partial_update']:
             return CreateRecipeSerializer
@@ -62,102 +193,234 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return (IsAuthor(),)
         return super().get_permissions()
 
+    @atomic()
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        User.objects.filter(pk=self.request.user.pk).update(
+            recipes_count=F('recipes_count') + 1)
 
-    @action(methods=['post'],
-            detail=True,
-            permission_classes=[IsAuthenticated])
-    def shopping_cart(self, request, pk=None):
+    @atomic()
+    def perform_destroy(self, instance):
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=decrement('recipes_count'))
+        shopping_list.remove_recipe(instance.pk)
+        instance.delete()
+
+    def add_relation(self, model, counter, pk, message):
         recipe = get_object_or_404(Recipe, pk=pk)
-        if ShoppingCart.objects.filter(recipe=recipe,
-                                       user=request.user).exists():
+        try:
+            with atomic():
+                lock_relations(self.request.user)
+                model.objects.create(recipe=recipe, user=self.request.user)
+                Recipe.objects.filter(pk=recipe.pk).update(
+                    **{counter: F(counter) + 1})
+                if model is ShoppingCart:
+                    shopping_list.change_recipes(
+                        self.request.user.pk, [recipe.pk], 1)
+        except IntegrityError:
             return Response(
-                {'detail': 'Данное блюдо уже находится в списке покупок'},
+                {'detail': message},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        ShoppingCart.objects.create(recipe=recipe,
-                                    user=request.user)
+        UserRelations.changed(model, self.request.user)
         serializer = RecipeInfoSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    @shopping_cart.mapping.delete
-    def delete_shopping_cart(self, request, pk=None):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        if not ShoppingCart.objects.filter(recipe=recipe,
-                                           user=request.user).exists():
+    def delete_relation(self, model, counter, pk, message):
+        with atomic():
+            lock_relations(self.request.user)
+            deleted, _ = model.objects.filter(
+                recipe_id=pk, user=self.request.user).delete()
+            if deleted:
+                Recipe.objects.filter(pk=pk).update(
+                    **{counter: decrement(counter)})
+                if model is ShoppingCart:
+                    shopping_list.change_recipes(
+                        self.request.user.pk, [pk], -1)
+        if not deleted:
+            get_object_or_404(Recipe, pk=pk)
             return Response(
-                {'detail': 'Данное блюдо не находится в списке покупок'},
+                {'detail': message},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        user_recipe = ShoppingCart.objects.get(recipe=recipe,
-                                               user=request.user)
-        user_recipe.delete()
+        UserRelations.changed(model, self.request.user)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def batch_relation(self, model, counter, add):
+        with atomic():
+            changed, results = apply_batch(
+                self.request, model, 'recipe', Recipe.objects.all(), add)
+            if changed:
+                Recipe.objects.filter(pk__in=changed).update(
+                    **{counter: count_subquery(model, 'recipe')})
+                if model is ShoppingCart:
+                    shopping_list.change_recipes(
+                        self.request.user.pk, changed, 1 if add else -1)
+        if changed:
+            UserRelations.changed(model, self.request.user)
+        return Response({'results': results})
+
+    @action(methods=['post'],
+            detail=False,
+            url_path='shopping_cart',
+            permission_classes=[IsAuthenticated])
+    def shopping_cart_batch(self, request):
+        return self.batch_relation(ShoppingCart, 'in_carts_count', True)
+
+    @shopping_cart_batch.mapping.delete
+    def delete_shopping_cart_batch(self, request):
+        return self.batch_relation(ShoppingCart, 'in_carts_count', False)
+
+    @action(methods=['post'],
+            detail=False,
+            url_path='favorite',
+            permission_classes=[IsAuthenticated])
+    def favorite_batch(self, request):
+        return self.batch_relation(Favorite, 'favorites_count', True)
+
+    @favorite_batch.mapping.delete
+    def delete_favorite_batch(self, request):
+        return self.batch_relation(Favorite, 'favorites_count', False)
+
+    @action(methods=['post'],
+            detail=True,
+            permission_classes=[IsAuthenticated])
+    def shopping_cart(self, request, pk=None):
+        return self.add_relation(
+            ShoppingCart, 'in_carts_count', pk,
+            'Данное блюдо уже находится в списке покупок'
+        )
+
+    @shopping_cart.mapping.delete
+    def delete_shopping_cart(self, request, pk=None):
+        return self.delete_relation(
+            ShoppingCart, 'in_carts_count', pk,
+            'Данное блюдо не находится в списке покупок'
+        )
+
     @action(methods=['post'],
             detail=True,
             permission_classes=[IsAuthenticated])
     def favorite(self, request, pk=None):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        if Favorite.objects.filter(recipe=recipe,
-                                   user=request.user).exists():
-            return Response(
-                {'detail': 'Данное блюдо уже находится в списке любимых блюд'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        Favorite.objects.create(recipe=recipe,
-                                user=request.user)
-        serializer = RecipeInfoSerializer(recipe)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+        return self.add_relation(
+            Favorite, 'favorites_count', pk,
+            'Данное блюдо уже находится в списке любимых блюд'
+        )
 
     @favorite.mapping.delete
     def delete_favorite(self, request, pk=None):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        if not Favorite.objects.filter(recipe=recipe,
-                                       user=request.user).exists():
-            return Response(
-                {'detail': 'Данного блюда нет в списке любимых блюд'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        favorite_dish = Favorite.objects.get(recipe=recipe,
-                                             user=request.user)
-        favorite_dish.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+        return self.delete_relation(
+            Favorite, 'favorites_count', pk,
+            'Данного блюда нет в списке любимых блюд'
+        )
+
+    @action(methods=['get'], detail=False)
+    def pantry(self, request):
+        try:
+            ingredient_ids = [
+                int(ingredient_id)
+                for value in request.query_params.getlist('ingredients')
+                for ingredient_id in value.split(',') if ingredient_id
+            ]
+            max_missing = request.query_params.get('max_missing')
+            if max_missing is not None:
+                max_missing = int(max_missing)
+        except ValueError:
+            raise ValidationError(
+                'ingredients и max_missing должны быть целыми числами.')
+        matches = pantry_index.search(ingredient_ids, max_missing)
+        page = self.paginate_queryset(matches)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page])
+        page = [match for match in page if match[0] in recipes]
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page], many=True)
+        for item, (_, coverage, missing) in zip(serializer.data, page):
+            item['coverage'] = round(coverage, 4)
+            item['missing'] = missing
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=['get'],
+            detail=False,
+            permission_classes=[IsAuthenticated])
+    def shopping_list(self, request):
+        items = ShoppingListItem.objects.filter(
+            user=request.user
+        ).select_related('ingredient').order_by('ingredient__name')
+        serializer = ShoppingListItemSerializer(items, many=True)
+        return Response(serializer.data)
 
     @action(methods=['get'],
             detail=False,
             permission_classes=[IsAuthenticated])
     def download_shopping_cart(self, request):
-        recipe_ingredients = RecipeIngredient.objects.values(
-            'ingredient__name', 'ingredient__measurement_unit').annotate(
-            total_amount=Sum('amount'))
-        ingredients_count = {}
-        for recipe_ingredient in recipe_ingredients:
-            key = (
-                f"{recipe_ingredient['ingredient__name']}"
-                f"({recipe_ingredient['ingredient__measurement_unit']})"
+        file_type = request.query_params.get('type', 'txt')
+        if file_type not in SHOPPING_CART_FORMATS:
+            return Response(
+                {'detail': 'Неизвестный формат файла'},
+                status=status.HTTP_400_BAD_REQUEST
             )
-            amount = recipe_ingredient['total_amount']
-            ingredients_count[key] = amount
-        lines = [f'{key} - {value}' for key, value in
-                 ingredients_count.items()]
-        response_text = '\n'.join(lines)
-        response = HttpResponse(response_text.encode('utf-8'),
-                                content_type='text/plain; charset=utf-8')
+        ingredients = ShoppingListItem.objects.filter(
+            user=request.user
+        ).values(
+            'ingredient__name', 'ingredient__measurement_unit',
+            'total_amount'
+        ).order_by('ingredient__name')
+        content_type, render = SHOPPING_CART_FORMATS[file_type]
+        response = StreamingHttpResponse(
+            render(ingredients.iterator()),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{file_type}"'
+        )
         return response
 
 
 class CustomUserViewSet(UserViewSet):
-    pagination_class = PageNumberPagination
+    pagination_class = SubscriptionPagination
+
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            recipes_limit = -1
+        if recipes_limit < 0:
+            raise ValidationError(
+                {'recipes_limit': 'Ожидается неотрицательное целое число.'})
+        return recipes_limit
+
+    def prefetch_recipes(self, authors):
+        recipes = Recipe.objects.order_by('-pub_date', '-id')
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            ranked = Recipe.objects.filter(author__in=authors).annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=[F('author')],
+                    order_by=[F('pub_date').desc(), F('id').desc()]
+                )
+            ).values('id', 'row_number')
+            sql, params = ranked.query.sql_with_params()
+            recipes = recipes.filter(id__in=RawSQL(
+                f'SELECT ranked.id FROM ({sql}) ranked '
+                f'WHERE ranked.row_number <= %s',
+                (*params, recipes_limit)
+            ))
+        prefetch_related_objects(authors, Prefetch(
+            'recipes', queryset=recipes, to_attr='limited_recipes'))
 
     @action(methods=['get'],
             detail=False,
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         recipe_authors = User.objects.filter(
-            subscription_author__user=request.user)
+            subscription_author__user=request.user).order_by('-id')
         page = self.paginate_queryset(recipe_authors)
+        self.prefetch_recipes(page)
         serializer = SubscriptionSerializer(
             page,
             many=True,
@@ -175,27 +438,61 @@ class CustomUserViewSet(UserViewSet):
                 {'detail': 'Вы не можете подписаться на самого себя'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        if Subscription.objects.filter(user=request.user,
-                                       author=recipe_author).exists():
+        try:
+            with atomic():
+                Subscription.objects.create(user=request.user,
+                                            author=recipe_author)
+                User.objects.filter(pk=recipe_author.pk).update(
+                    subscribers_count=F('subscribers_count') + 1)
+        except IntegrityError:
             return Response(
                 {'detail': 'Вы уже подписаны на данного автора'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        Subscription.objects.create(user=request.user,
-                                    author=recipe_author)
-        serializer = SubscriptionSerializer(recipe_author)
+        UserRelations.changed(Subscription, request.user)
+        self.prefetch_recipes([recipe_author])
+        serializer = SubscriptionSerializer(
+            recipe_author,
+            context={'request': request}
+        )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
     def delete_subscribe(self, request, id=None):
-        recipe_author = get_object_or_404(User, id=id)
-        if not Subscription.objects.filter(user=request.user,
-                                           author=recipe_author).exists():
+        with atomic():
+            deleted, _ = Subscription.objects.filter(
+                user=request.user, author_id=id).delete()
+            if deleted:
+                User.objects.filter(pk=id).update(
+                    subscribers_count=decrement('subscribers_count'))
+        if not deleted:
+            get_object_or_404(User, id=id)
             return Response(
                 {'detail': 'Вы не подписаны на данного автора'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        subscription = Subscription.objects.get(user=request.user,
-                                                author=recipe_author)
-        subscription.delete()
+        UserRelations.changed(Subscription, request.user)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def batch_subscribe(self, add):
+        with atomic():
+            changed, results = apply_batch(
+                self.request, Subscription, 'author', User.objects.all(),
+                add, errors={self.request.user.pk: 'self_subscription'})
+            if changed:
+                User.objects.filter(pk__in=changed).update(
+                    subscribers_count=count_subquery(Subscription, 'author'))
+        if changed:
+            UserRelations.changed(Subscription, self.request.user)
+        return Response({'results': results})
+
+    @action(methods=['post'],
+            detail=False,
+            url_path='subscribe',
+            permission_classes=[IsAuthenticated])
+    def subscribe_batch(self, request):
+        return self.batch_subscribe(True)
+
+    @subscribe_batch.mapping.delete
+    def delete_subscribe_batch(self, request):
+        return self.batch_subscribe(False)
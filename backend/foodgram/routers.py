@@ -0,0 +1,40 @@
+from contextlib import contextmanager
+
+from asgiref.local import Local
+_state = Local()
+
+
+@contextmanager
+def read_from(database):
+    previous = getattr(_state, 'read_database', None)
+    _state.read_database = database
+    try:
+        yield
+    finally:
+        _state.read_database = previous
+
+
+def use_primary():
+    """Чтения внутри блока идут в основную базу.
+
+    Нужно там, где прочитанное кладется в общий кэш под новой версией:
+    отстающая реплика иначе закрепит в нем устаревшие данные.
+    """
+    return read_from(None)
+
+
+class PrimaryReplicaRouter:
+    """Направляет чтения в реплику, если ReplicaMiddleware разрешил это
+    для текущего запроса; записи и миграции идут в основную базу."""
+
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'read_database', None) or 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == 'default'
@@ -35,14 +35,31 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'api.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
+    'api.middleware.AuthenticationMiddleware',
+    'api.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Для этих путей сессии, сессионный пользователь и сообщения не
+# обрабатываются, см. api/middleware.py.
+LEAN_MIDDLEWARE_PATHS = ('/api/',)
+
+# Под ASGI (SERVER_MODE=asgi) горячие эндпоинты чтения выполняются
+# асинхронно, см. api/async_views.py.
+ASYNC_VIEWS = os.getenv('SERVER_MODE', 'wsgi') == 'asgi'
+
+# Сбор метрик по эндпоинтам (/api/_metrics, manage.py metricsreport).
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False') == 'True'
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 10))
+METRICS_N_PLUS_ONE_THRESHOLD = int(
+    os.getenv('METRICS_N_PLUS_ONE_THRESHOLD', 5))
+
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'api.metrics.MetricsMiddleware')
+
 ROOT_URLCONF = 'foodgram.urls'
 
 TEMPLATES = [
@@ -82,10 +99,91 @@ else:
             'USER': os.getenv('POSTGRES_USER', 'django'),
             'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
             'HOST': os.getenv('DB_HOST', ''),
-            'PORT': os.getenv('DB_PORT', 5432)
+            'PORT': os.getenv('DB_PORT', 5432),
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+            'DISABLE_SERVER_SIDE_CURSORS': (
+                os.getenv('DB_PGBOUNCER', 'False') == 'True'),
+            'OPTIONS': {
+                'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+                'keepalives': 1,
+                'keepalives_idle': 30,
+            },
         }
     }
 
+# Постоянные соединения (DB_CONN_MAX_AGE секунд, 0 — по соединению на
+# запрос) проверяются в начале каждого запроса, см. api/db.py.
+# Для пула соединений перед PostgreSQL ставится PgBouncer в режиме
+# pool_mode = transaction: DB_HOST/DB_PORT указывают на PgBouncer,
+# DB_PGBOUNCER=True отключает серверные курсоры (.iterator()), которые
+# не переживают смену серверного соединения между транзакциями.
+# Состояние сессии (SET, LISTEN, сессионные advisory-блокировки) проект
+# не использует: блокировки связей пользователя (api/views.py) живут до
+# конца транзакции, COPY в loadingredients выполняется в одной транзакции.
+DB_CONN_HEALTH_CHECKS = os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+# Реплика для чтения (DB_REPLICA_HOST): безопасные запросы к путям из
+# DB_REPLICA_PATHS читают из нее, клиент после изменения на
+# DB_REPLICA_PIN_SECONDS остается на основной базе (cookie
+# DB_REPLICA_PIN_COOKIE), см. api/middleware.py. В тестах реплика
+# зеркалирует основную базу: для проверки маршрутизации запустите тесты
+# с DB_REPLICA_HOST.
+DB_REPLICA = 'replica'
+DB_REPLICA_PATHS = ('/api/',)
+DB_REPLICA_PIN_COOKIE = 'db_pinned'
+DB_REPLICA_PIN_SECONDS = int(os.getenv('DB_REPLICA_PIN_SECONDS', 10))
+
+if not DEBUG and os.getenv('DB_REPLICA_HOST'):
+    DATABASES[DB_REPLICA] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['foodgram.routers.PrimaryReplicaRouter']
+    MIDDLEWARE.append('api.middleware.ReplicaMiddleware')
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# По умолчанию кэш локальный для каждого воркера gunicorn; чтобы воркеры
+# видели общие данные и сразу замечали изменения справочников, укажите
+# FileBasedCache или Memcached через CACHE_BACKEND и CACHE_LOCATION.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
+# Кэш общий для всех воркеров (не LocMemCache и не DummyCache).
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+REFERENCE_CACHE_TIMEOUT = int(os.getenv('REFERENCE_CACHE_TIMEOUT', 300))
+
+# Максимум ингредиентов в ответе поиска по названию (автодополнение).
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+# Время хранения избранного, корзины и подписок пользователя в кэше
+# (0 - загружать заново в каждом запросе). Версия множеств меняется в
+# кэше воркера, обработавшего изменение, поэтому между запросами они
+# кэшируются только с общим кэшем.
+USER_RELATIONS_CACHE_TIMEOUT = int(
+    os.getenv('USER_RELATIONS_CACHE_TIMEOUT', 300)) if SHARED_CACHE else 0
+
+# Время хранения пользователя по токену в кэше аутентификации.
+# Отзыв токена (выход, удаление токена, смена пароля, деактивация)
+# очищает кэш, поэтому кэширование включается только с общим кэшем:
+# с локальным кэшем другие воркеры принимали бы отозванный токен.
+AUTH_TOKEN_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 60)) if SHARED_CACHE else 0
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -105,6 +203,10 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
@@ -113,7 +215,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
     'PAGE_SIZE': 6,
 }
@@ -142,6 +244,12 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Фоновая обработка изображений рецептов: число потоков на процесс
+# (0 - обрабатывать сразу после коммита в том же потоке) и максимальный
+# размер загружаемого файла в байтах.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+IMAGE_MAX_SIZE = int(os.getenv('IMAGE_MAX_SIZE', 10 * 1024 * 1024))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -15,12 +15,14 @@ admin.site.register(Favorite)
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     def get_favorite_count(self, obj):
-        return obj.favorite_set.count()
+        return obj.favorites_count
 
     get_favorite_count.short_description = 'Добавление рецепта в избранное'
+    get_favorite_count.admin_order_field = 'favorites_count'
 
     list_display = ('name', 'author', 'get_favorite_count')
     list_filter = ('name', 'author', 'tags')
+    list_select_related = ('author',)
 
 
 @admin.register(Ingredient)
@@ -0,0 +1,47 @@
+from time import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from foodgram.routers import use_primary
+from recipes.models import Recipe, Tag
+
+
+def version_key(model, pk=None):
+    if pk is None:
+        return f'version:{model._meta.label_lower}'
+    return f'version:{model._meta.label_lower}:{pk}'
+
+
+def get_version(model, pk=None):
+    key = version_key(model, pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time(), settings.REFERENCE_CACHE_TIMEOUT)
+        version = cache.get(key, time())
+    return version
+
+
+def bump_version(model, pk=None):
+    version = time()
+    cache.set(version_key(model, pk), version,
+              settings.REFERENCE_CACHE_TIMEOUT)
+    return version
+
+
+def bump_recipe_versions(recipe_ids):
+    version = time()
+    cache.set_many(
+        {version_key(Recipe, pk): version for pk in recipe_ids},
+        settings.REFERENCE_CACHE_TIMEOUT
+    )
+
+
+def tag_ids_by_slug():
+    key = f'tags:slugs:{get_version(Tag)}'
+    slugs = cache.get(key)
+    if slugs is None:
+        with use_primary():
+            slugs = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, slugs, settings.REFERENCE_CACHE_TIMEOUT)
+    return slugs
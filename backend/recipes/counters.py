@@ -0,0 +1,37 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(
+                **{field: OuterRef('pk')}
+            ).order_by().values(field).annotate(
+                count=Count('pk')
+            ).values('count'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def decrement(field):
+    """Уменьшает счетчик на единицу, не опуская его ниже нуля.
+
+    Разошедшийся с данными счетчик иначе нарушил бы ограничение
+    PositiveIntegerField, и удаление связи завершилось бы ошибкой.
+    """
+    return Greatest(F(field) - 1, 0)
+
+
+def rebuild_counters(recipe_model, user_model, favorite_model,
+                     shopping_cart_model, subscription_model):
+    recipe_model.objects.update(
+        favorites_count=count_subquery(favorite_model, 'recipe'),
+        in_carts_count=count_subquery(shopping_cart_model, 'recipe')
+    )
+    user_model.objects.update(
+        recipes_count=count_subquery(recipe_model, 'author'),
+        subscribers_count=count_subquery(subscription_model, 'author')
+    )
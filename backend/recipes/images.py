@@ -0,0 +1,125 @@
+import base64
+import binascii
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image, UnidentifiedImageError
+
+from recipes.cache import bump_version
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+STAGING_DIR = 'staging'
+VARIANTS = (
+    ('image_thumbnail', 300, None),
+    ('image_medium', 800, None),
+    ('image_webp', 800, 'WEBP'),
+)
+ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='recipe-images'
+        )
+    return _executor
+
+
+def stage_image(base64_data):
+    """Сохраняет base64-строку изображения на диск без декодирования."""
+    return default_storage.save(
+        os.path.join(STAGING_DIR, f'{uuid4().hex}.b64'),
+        ContentFile(base64_data.encode())
+    )
+
+
+def schedule_processing(recipe_id, staged_name):
+    """Запускает обработку после коммита транзакции, создавшей рецепт."""
+    if settings.IMAGE_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(
+            process_in_worker, recipe_id, staged_name))
+    else:
+        transaction.on_commit(
+            lambda: process_image(recipe_id, staged_name))
+
+
+def process_in_worker(recipe_id, staged_name):
+    try:
+        process_image(recipe_id, staged_name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение рецепта %s',
+                         recipe_id)
+    finally:
+        connection.close()
+
+
+def render_variant(image, size, image_format):
+    variant = image.copy()
+    variant.thumbnail((size, size))
+    image_format = image_format or image.format
+    if image_format == 'JPEG' and variant.mode not in ('RGB', 'L'):
+        variant = variant.convert('RGB')
+    content = BytesIO()
+    variant.save(content, format=image_format)
+    return ContentFile(content.getvalue()), image_format.lower()
+
+
+def save_file(field_name, file_name, content):
+    field = Recipe._meta.get_field(field_name)
+    return default_storage.save(
+        field.generate_filename(None, file_name), content)
+
+
+def process_image(recipe_id, staged_name):
+    if not default_storage.exists(staged_name):
+        return
+    with default_storage.open(staged_name) as staged:
+        base64_data = staged.read()
+    try:
+        content = base64.b64decode(base64_data)
+        image = Image.open(BytesIO(content))
+        image.load()
+    except (binascii.Error, ValueError, UnidentifiedImageError, OSError):
+        logger.warning('Поврежденное изображение рецепта %s', recipe_id)
+        Recipe.objects.filter(
+            pk=recipe_id, image_staged=staged_name
+        ).update(image_staged='')
+        default_storage.delete(staged_name)
+        return
+    base_name = uuid4().hex
+    updates = {'image': save_file(
+        'image', f'{base_name}.{image.format.lower()}', ContentFile(content))}
+    for field_name, size, image_format in VARIANTS:
+        variant, extension = render_variant(image, size, image_format)
+        updates[field_name] = save_file(
+            field_name, f'{base_name}_{size}.{extension}', variant)
+    with transaction.atomic():
+        previous = Recipe.objects.select_for_update().filter(
+            pk=recipe_id, image_staged=staged_name
+        ).values_list(*updates).first()
+        if previous is not None:
+            Recipe.objects.filter(pk=recipe_id).update(
+                image_staged='', **updates)
+    if previous is None:
+        previous = updates.values()
+    else:
+        bump_version(Recipe, recipe_id)
+    # Замененные файлы (или новые, если изображение уже сменилось
+    # повторно) удаляются после того, как рецепт указывает на новые.
+    for name in previous:
+        if name:
+            default_storage.delete(name)
+    default_storage.delete(staged_name)
@@ -0,0 +1,144 @@
+import os
+import random
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.counters import rebuild_counters
+from recipes.models import (Favorite,
+                            Ingredient,
+                            Recipe,
+                            RecipeIngredient,
+                            ShoppingCart,
+                            ShoppingListItem,
+                            Tag)
+from recipes.shopping_list import rebuild_shopping_lists
+from users.models import Subscription
+
+User = get_user_model()
+
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+WORDS = ('суп', 'салат', 'пирог', 'рагу', 'каша', 'запеканка', 'соус',
+         'жаркое', 'блины', 'котлеты', 'домашний', 'быстрый', 'летний',
+         'острый', 'сливочный', 'овощной', 'куриный', 'рыбный')
+
+
+class Command(BaseCommand):
+    help = "Generate a synthetic dataset for load testing"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--carts-per-user', type=int, default=5)
+        parser.add_argument('--subscriptions-per-user', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--ingredients',
+            default=os.path.join(
+                settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='CSV с ингредиентами, если таблица ингредиентов пуста.'
+        )
+        parser.add_argument(
+            '--password', default='benchmark-password',
+            help='Пароль всех созданных пользователей.'
+        )
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        print('Началась генерация данных.')
+        self.load_ingredients(options['ingredients'])
+        with transaction.atomic():
+            tags = self.create_tags()
+            users = self.create_users(options['users'], options['password'])
+            recipes = self.create_recipes(
+                users, tags, options['recipes'],
+                options['ingredients_per_recipe'])
+            self.create_relations(users, recipes, options)
+            rebuild_counters(Recipe, User, Favorite, ShoppingCart,
+                             Subscription)
+            rebuild_shopping_lists(RecipeIngredient, ShoppingListItem)
+        call_command('rebuildsearchindex')
+        print(f'Генерация данных завершена: {len(users)} пользователей, '
+              f'{len(recipes)} рецептов.')
+
+    def load_ingredients(self, path):
+        if not Ingredient.objects.exists():
+            call_command('loadingredients', path, format='csv')
+        if not Ingredient.objects.exists():
+            raise CommandError('Не удалось загрузить ингредиенты.')
+
+    def create_tags(self):
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color})
+        return list(Tag.objects.all())
+
+    def create_users(self, count, password):
+        password = make_password(password)
+        start = User.objects.count()
+        User.objects.bulk_create([
+            User(username=f'bench{start + i}',
+                 email=f'bench{start + i}@example.com',
+                 first_name='Тест',
+                 last_name=f'Пользователь {start + i}',
+                 password=password)
+            for i in range(count)
+        ], batch_size=1000)
+        return list(User.objects.filter(
+            username__startswith='bench').values_list('id', flat=True))
+
+    def create_recipes(self, users, tags, count, ingredients_per_recipe):
+        ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True))
+        created = Recipe.objects.bulk_create([
+            Recipe(name=' '.join(random.sample(WORDS, 3)).capitalize(),
+                   text=' '.join(random.choices(WORDS, k=40)),
+                   cooking_time=random.randint(5, 180),
+                   author_id=random.choice(users))
+            for _ in range(count)
+        ], batch_size=1000)
+        if created and created[0].pk is None:
+            created = Recipe.objects.order_by('-id')[:count]
+        recipe_ids = [recipe.pk for recipe in created]
+        tag_model = Recipe.tags.through
+        tag_model.objects.bulk_create([
+            tag_model(recipe_id=recipe_id, tag_id=tag.id)
+            for recipe_id in recipe_ids
+            for tag in random.sample(tags, random.randint(1, len(tags)))
+        ], batch_size=1000)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                             amount=random.randint(1, 500))
+            for recipe_id in recipe_ids
+            for ingredient_id in random.sample(
+                ingredient_ids,
+                min(ingredients_per_recipe, len(ingredient_ids)))
+        ], batch_size=1000)
+        return recipe_ids
+
+    def create_relations(self, users, recipes, options):
+        for model, per_user in ((Favorite, options['favorites_per_user']),
+                                (ShoppingCart, options['carts_per_user'])):
+            model.objects.bulk_create([
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in users
+                for recipe_id in random.sample(
+                    recipes, min(per_user, len(recipes)))
+            ], batch_size=1000, ignore_conflicts=True)
+        Subscription.objects.bulk_create([
+            Subscription(user_id=user_id, author_id=author_id)
+            for user_id in users
+            for author_id in random.sample(
+                users, min(options['subscriptions_per_user'], len(users)))
+            if author_id != user_id
+        ], batch_size=1000, ignore_conflicts=True)
@@ -1,27 +1,173 @@
-from django.core.management.base import BaseCommand
+import csv
+import json
+import os
+from io import StringIO
+from time import monotonic
+
 from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
 from recipes.models import Ingredient
 
-import json
-import os
+
+def iter_json_array(file, chunk_size=64 * 1024):
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = file.read(chunk_size)
+        buffer += chunk
+        position = 0
+        while True:
+            while (position < len(buffer)
+                   and buffer[position] in ' \t\r\n,[]'):
+                if buffer[position] == '[':
+                    started = True
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                raise CommandError('Ожидается JSON-массив.')
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if not chunk:
+                    raise CommandError('Файл JSON поврежден.')
+                break
+            yield item
+            position = end
+        buffer = buffer[position:]
+        if not chunk:
+            return
+
+
+def iter_rows(file_path, file_format):
+    with open(file_path, encoding='utf-8') as f:
+        if file_format == 'csv':
+            for row in csv.reader(f):
+                if row:
+                    yield row[0], row[1]
+        else:
+            for ingredient in iter_json_array(f):
+                yield ingredient['name'], ingredient['measurement_unit']
+
+
+def iter_batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class RowsFile:
+    """Файлоподобная обертка над строками для COPY FROM STDIN."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.buffer = ''
+
+    def read(self, size=-1):
+        lines = StringIO()
+        writer = csv.writer(lines)
+        while size < 0 or len(self.buffer) + lines.tell() < size:
+            try:
+                writer.writerow(next(self.rows))
+            except StopIteration:
+                break
+        self.buffer += lines.getvalue()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
 
 
 class Command(BaseCommand):
     help = "Load ingredients"
 
-    def handle(self, *args, **options):
-        file_path = os.path.join(
-            settings.BASE_DIR,
-            'data',
-            'ingredients.json'
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(
+                settings.BASE_DIR, 'data', 'ingredients.json'),
+            help='Путь к файлу ингредиентов (JSON или CSV).'
+        )
+        parser.add_argument(
+            '--format', choices=('json', 'csv'),
+            help='Формат файла; по умолчанию определяется по расширению.'
         )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одной вставке.'
+        )
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Загрузить через COPY (только PostgreSQL).'
+        )
+
+    def handle(self, *args, **options):
+        file_path = options['path']
+        file_format = options['format'] or (
+            'csv' if file_path.endswith('.csv') else 'json')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным.')
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy доступен только для PostgreSQL.')
         print('Началась загрузка ингредиентов.')
-        with open(file_path) as f:
-            ingredients = json.load(f)
-        Ingredient.objects.bulk_create([
-            Ingredient(
-                name=ingredient['name'],
-                measurement_unit=ingredient['measurement_unit'])
-            for ingredient in ingredients
-        ])
-        print('Загрузка ингредиентов завершена.')
+        started = monotonic()
+        count_before = Ingredient.objects.count()
+        rows = iter_rows(file_path, file_format)
+        if options['copy']:
+            processed = self.copy(rows)
+        else:
+            processed = self.bulk_create(rows, options['batch_size'])
+        added = Ingredient.objects.count() - count_before
+        elapsed = monotonic() - started
+        print(
+            f'Загрузка ингредиентов завершена: обработано {processed}, '
+            f'добавлено {added} за {elapsed:.2f} с '
+            f'({processed / max(elapsed, 1e-6):.0f} строк/с).'
+        )
+
+    def bulk_create(self, rows, batch_size):
+        processed = 0
+        for batch in iter_batches(rows, batch_size):
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=name, measurement_unit=measurement_unit)
+                 for name, measurement_unit in batch],
+                ignore_conflicts=True
+            )
+            processed += len(batch)
+        return processed
+
+    def copy(self, rows):
+        processed = 0
+
+        def counted(rows):
+            nonlocal processed
+            for row in rows:
+                processed += 1
+                yield row
+
+        table = Ingredient._meta.db_table
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredient_import '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredient_import (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                RowsFile(counted(rows))
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'SELECT name, measurement_unit FROM ingredient_import '
+                f'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+        return processed
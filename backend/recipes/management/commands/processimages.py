@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import process_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Process staged recipe images left by interrupted workers"
+
+    def handle(self, *args, **options):
+        print('Началась обработка изображений.')
+        staged = Recipe.objects.exclude(
+            image_staged=''
+        ).values_list('id', 'image_staged')
+        for recipe_id, staged_name in staged:
+            process_image(recipe_id, staged_name)
+        print(f'Обработка изображений завершена: {len(staged)}.')
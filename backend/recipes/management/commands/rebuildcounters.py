@@ -0,0 +1,17 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from recipes.counters import rebuild_counters
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscription
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Rebuild favorite, cart, recipe and subscriber counters"
+
+    def handle(self, *args, **options):
+        print('Началась пересборка счетчиков.')
+        rebuild_counters(Recipe, User, Favorite, ShoppingCart, Subscription)
+        print('Пересборка счетчиков завершена.')
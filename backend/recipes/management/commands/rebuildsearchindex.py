@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import Recipe
+from recipes.search import update_search_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the recipe full-text search index"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Количество рецептов в одной пачке.'
+        )
+
+    def handle(self, *args, **options):
+        print('Началась пересборка поискового индекса.')
+        recipe_ids = list(Recipe.objects.values_list('id', flat=True))
+        batch_size = options['batch_size']
+        for start in range(0, len(recipe_ids), batch_size):
+            update_search_index(recipe_ids[start:start + batch_size])
+        print(f'Пересборка поискового индекса завершена: {len(recipe_ids)}.')
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.models import RecipeIngredient, ShoppingListItem
+from recipes.shopping_list import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized shopping lists from shopping carts"
+
+    def handle(self, *args, **options):
+        print('Началась пересборка списков покупок.')
+        with transaction.atomic():
+            rebuild_shopping_lists(RecipeIngredient, ShoppingListItem)
+        print('Пересборка списков покупок завершена: '
+              f'{ShoppingListItem.objects.count()} позиций.')
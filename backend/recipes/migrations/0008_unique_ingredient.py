@@ -0,0 +1,48 @@
+# Generated by Django 3.2 on 2026-10-18 10:22
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicates(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        # Проверки отложенных внешних ключей выполняются сразу, иначе
+        # AddConstraint ниже упадет с "pending trigger events".
+        schema_editor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    ingredient_model = apps.get_model('recipes', 'Ingredient')
+    recipe_ingredient_model = apps.get_model('recipes', 'RecipeIngredient')
+    duplicates = ingredient_model.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        keep_id=Min('id'), total=Count('id')
+    ).filter(total__gt=1)
+    for duplicate in duplicates:
+        keep_id = duplicate['keep_id']
+        duplicate_ids = list(ingredient_model.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit']
+        ).exclude(id=keep_id).values_list('id', flat=True))
+        for duplicate_id in duplicate_ids:
+            recipe_ingredient_model.objects.filter(
+                ingredient_id=duplicate_id,
+                recipe__recipe_ingredients__ingredient_id=keep_id
+            ).delete()
+            recipe_ingredient_model.objects.filter(
+                ingredient_id=duplicate_id
+            ).update(ingredient_id=keep_id)
+        ingredient_model.objects.filter(id__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_unique_constraints'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
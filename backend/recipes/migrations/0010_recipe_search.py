@@ -0,0 +1,49 @@
+# Generated by Django 3.2 on 2026-10-18 10:25
+
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+from recipes.search import update_search_index
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_idx '
+            'ON recipes_recipe USING gin (search_vector)'
+        )
+    recipe_model = apps.get_model('recipes', 'Recipe')
+    update_search_index(
+        recipe_model.objects.values_list('id', flat=True), recipe_model)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS recipes_recipe_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.CreateModel(
+            name='RecipeSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=200)),
+                ('weight', models.PositiveSmallIntegerField()),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to='recipes.recipe')),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,3 +1,4 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.utils import timezone
@@ -18,6 +19,12 @@ class Ingredient(models.Model):
     name = models.CharField(max_length=200)
     measurement_unit = models.CharField(max_length=200)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'measurement_unit'],
+                                    name='unique_ingredient'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -30,10 +37,32 @@ class Recipe(models.Model):
     text = models.TextField()
     cooking_time = models.IntegerField()
     image = models.ImageField(upload_to='images/', null=True, blank=True)
+    image_thumbnail = models.ImageField(upload_to='images/variants/',
+                                        null=True, blank=True)
+    image_medium = models.ImageField(upload_to='images/variants/',
+                                     null=True, blank=True)
+    image_webp = models.ImageField(upload_to='images/variants/',
+                                   null=True, blank=True)
+    image_staged = models.CharField(max_length=255, blank=True)
+    search_vector = SearchVectorField(null=True, editable=False)
     author = models.ForeignKey(User,
                                on_delete=models.CASCADE,
                                related_name='recipes')
     pub_date = models.DateTimeField(default=timezone.now)
+    favorites_count = models.PositiveIntegerField(default=0)
+    in_carts_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['-favorites_count', '-pub_date'],
+                         name='recipe_favorites_count_idx'),
+            models.Index(fields=['-in_carts_count', '-pub_date'],
+                         name='recipe_in_carts_count_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -48,21 +77,70 @@ class RecipeIngredient(models.Model):
                                    related_name='recipe_ingredients')
     amount = models.SmallIntegerField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['recipe', 'ingredient'],
+                                    name='unique_recipe_ingredient'),
+        ]
+
     def __str__(self):
         return f'{self.ingredient.name} {self.amount} шт. идет в {self.recipe}'
 
 
+class RecipeSearchTerm(models.Model):
+    recipe = models.ForeignKey(Recipe,
+                               on_delete=models.CASCADE,
+                               related_name='search_terms')
+    term = models.CharField(max_length=200, db_index=True)
+    weight = models.PositiveSmallIntegerField()
+
+    def __str__(self):
+        return f'{self.term} ({self.weight}) в {self.recipe_id}'
+
+
 class ShoppingCart(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_shopping_cart'),
+        ]
+
     def __str__(self):
         return self.recipe.name
 
 
+class ShoppingListItem(models.Model):
+    """Сумма ингредиента по всем рецептам в списке покупок
+    пользователя, обновляется при изменении списка и рецептов."""
+
+    user = models.ForeignKey(User,
+                             on_delete=models.CASCADE,
+                             related_name='shopping_list')
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE)
+    total_amount = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_shopping_list_item'),
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} {self.total_amount} для {self.user}'
+
+
 class Favorite(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'recipe'],
+                                    name='unique_favorite'),
+        ]
+
     def __str__(self):
         return self.recipe.name
@@ -0,0 +1,94 @@
+from collections import defaultdict
+from threading import Lock
+
+from foodgram.routers import use_primary
+from recipes.cache import bump_version, get_version
+from recipes.models import RecipeIngredient
+
+
+class PantryIndex:
+    """Инвертированный индекс ингредиент -> рецепты в памяти процесса.
+
+    Строится из RecipeIngredient при первом обращении и после смены
+    версии (изменения в других процессах), а изменения рецептов в текущем
+    процессе применяются точечно через refresh_recipe/remove_recipe.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._recipes = {}
+        self._ingredients = defaultdict(set)
+
+    def _load(self):
+        version = get_version(RecipeIngredient)
+        with self._lock:
+            if self._version == version:
+                return
+            recipes = defaultdict(set)
+            ingredients = defaultdict(set)
+            with use_primary():
+                rows = RecipeIngredient.objects.values_list(
+                    'recipe_id', 'ingredient_id').iterator()
+                for recipe_id, ingredient_id in rows:
+                    recipes[recipe_id].add(ingredient_id)
+                    ingredients[ingredient_id].add(recipe_id)
+            self._recipes = dict(recipes)
+            self._ingredients = ingredients
+            self._version = version
+
+    def _replace(self, recipe_id, ingredient_ids):
+        for ingredient_id in self._recipes.pop(recipe_id, ()):
+            self._ingredients[ingredient_id].discard(recipe_id)
+        if ingredient_ids:
+            self._recipes[recipe_id] = ingredient_ids
+            for ingredient_id in ingredient_ids:
+                self._ingredients[ingredient_id].add(recipe_id)
+
+    def _apply(self, recipe_id, ingredient_ids):
+        with self._lock:
+            self._replace(recipe_id, ingredient_ids)
+            # Новая версия принимается, только если до изменения индекс
+            # был актуален: иначе он пропустил бы изменения других
+            # процессов и остается устаревшим до следующей пересборки.
+            current = self._version is not None and (
+                get_version(RecipeIngredient) == self._version)
+            version = bump_version(RecipeIngredient)
+            if current:
+                self._version = version
+
+    def refresh_recipe(self, recipe_id):
+        ingredient_ids = set(RecipeIngredient.objects.filter(
+            recipe_id=recipe_id).values_list('ingredient_id', flat=True))
+        self._apply(recipe_id, ingredient_ids)
+
+    def remove_recipe(self, recipe_id):
+        self._apply(recipe_id, set())
+
+    def search(self, ingredient_ids, max_missing=None):
+        """Возвращает [(recipe_id, coverage, missing)] по убыванию покрытия.
+
+        coverage - доля ингредиентов рецепта, которые есть у пользователя,
+        missing - сколько ингредиентов рецепта не хватает.
+        """
+        self._load()
+        matched = defaultdict(int)
+        with self._lock:
+            for ingredient_id in set(ingredient_ids):
+                for recipe_id in self._ingredients.get(ingredient_id, ()):
+                    matched[recipe_id] += 1
+            totals = {
+                recipe_id: len(self._recipes[recipe_id])
+                for recipe_id in matched
+            }
+        results = []
+        for recipe_id, count in matched.items():
+            missing = totals[recipe_id] - count
+            if max_missing is not None and missing > max_missing:
+                continue
+            results.append((recipe_id, count / totals[recipe_id], missing))
+        results.sort(key=lambda result: (-result[1], result[2], -result[0]))
+        return results
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,161 @@
+import re
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+
+from django.contrib.postgres.search import (SearchQuery,
+                                            SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import (Count,
+                              F,
+                              IntegerField,
+                              OuterRef,
+                              Subquery,
+                              Sum,
+                              Value)
+
+from foodgram.routers import use_primary
+from recipes.cache import get_version
+from recipes.models import Ingredient, Recipe, RecipeSearchTerm
+
+SEARCH_CONFIG = 'russian'
+# Поля поискового документа: вес в PostgreSQL и вес в резервном индексе.
+SEARCH_FIELDS = (
+    ('name', 'A', 4),
+    ('ingredients', 'B', 2),
+    ('text', 'C', 1),
+)
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для поиска по названию.
+
+    Используется, когда база не умеет искать без учета регистра
+    по кириллице (SQLite). Строки хранятся отсортированными по названию
+    в нижнем регистре: совпадения по началу находятся бинарным поиском,
+    совпадения по подстроке - проходом по списку. Индекс перестраивается,
+    когда меняется версия справочника ингредиентов.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._keys = None
+        self._rows = None
+
+    def _load(self):
+        version = get_version(Ingredient)
+        with self._lock:
+            if self._version != version:
+                with use_primary():
+                    rows = sorted(
+                        Ingredient.objects.values(
+                            'id', 'name', 'measurement_unit'),
+                        key=lambda row: (row['name'].lower(), row['id'])
+                    )
+                self._keys = [row['name'].lower() for row in rows]
+                self._rows = rows
+                self._version = version
+            return self._keys, self._rows
+
+    def search(self, query, limit=None):
+        """Совпадения по началу названия, затем по подстроке, не больше
+        limit строк."""
+        query = query.lower()
+        keys, rows = self._load()
+        start = bisect_left(keys, query)
+        end = start
+        while (end < len(keys) and keys[end].startswith(query)
+               and (limit is None or end - start < limit)):
+            end += 1
+        matches = rows[start:end]
+        for index, key in enumerate(keys):
+            if limit is not None and len(matches) >= limit:
+                break
+            if query in key and not key.startswith(query):
+                matches.append(rows[index])
+        return matches
+
+
+ingredient_index = IngredientIndex()
+
+
+def tokenize(text):
+    return re.findall(r'\w+', text.lower())
+
+
+def search_documents(recipe_model, recipe_ids):
+    documents = {
+        recipe['id']: {**recipe, 'ingredients': []}
+        for recipe in recipe_model.objects.filter(
+            id__in=recipe_ids).values('id', 'name', 'text')
+    }
+    recipe_ingredient_model = recipe_model._meta.get_field(
+        'recipe_ingredients').related_model
+    ingredient_names = recipe_ingredient_model.objects.filter(
+        recipe_id__in=documents
+    ).values_list('recipe_id', 'ingredient__name')
+    for recipe_id, name in ingredient_names:
+        documents[recipe_id]['ingredients'].append(name)
+    for document in documents.values():
+        document['ingredients'] = ' '.join(document['ingredients'])
+    return documents
+
+
+def update_search_index(recipe_ids, recipe_model=Recipe):
+    """Пересобирает поисковые документы рецептов.
+
+    В PostgreSQL документ хранится в Recipe.search_vector (индекс GIN),
+    в остальных базах - в таблице терминов RecipeSearchTerm.
+    """
+    documents = search_documents(recipe_model, recipe_ids)
+    if connection.vendor == 'postgresql':
+        for recipe_id, document in documents.items():
+            vector = None
+            for field, weight, _ in SEARCH_FIELDS:
+                field_vector = SearchVector(
+                    Value(document[field]), weight=weight,
+                    config=SEARCH_CONFIG)
+                vector = field_vector if vector is None else (
+                    vector + field_vector)
+            recipe_model.objects.filter(pk=recipe_id).update(
+                search_vector=vector)
+        return
+    term_model = recipe_model._meta.get_field('search_terms').related_model
+    term_model.objects.filter(recipe_id__in=recipe_ids).delete()
+    terms = []
+    for recipe_id, document in documents.items():
+        weights = defaultdict(int)
+        for field, _, weight in SEARCH_FIELDS:
+            for term in tokenize(document[field]):
+                weights[term[:200]] = max(weights[term[:200]], weight)
+        terms.extend(
+            term_model(recipe_id=recipe_id, term=term, weight=weight)
+            for term, weight in weights.items()
+        )
+    term_model.objects.bulk_create(terms, batch_size=1000)
+
+
+def search_recipes(queryset, value):
+    """Фильтрует рецепты по запросу и сортирует по релевантности."""
+    ordering = queryset.query.order_by
+    if connection.vendor == 'postgresql':
+        query = SearchQuery(value, config=SEARCH_CONFIG)
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', *ordering)
+    terms = set(tokenize(value))
+    if not terms:
+        return queryset
+    matches = RecipeSearchTerm.objects.filter(
+        recipe=OuterRef('pk'), term__in=terms
+    ).order_by().values('recipe')
+    return queryset.annotate(
+        matched=Subquery(
+            matches.annotate(total=Count('term')).values('total'),
+            output_field=IntegerField()),
+        rank=Subquery(
+            matches.annotate(total=Sum('weight')).values('total'),
+            output_field=IntegerField())
+    ).filter(matched=len(terms)).order_by('-rank', *ordering)
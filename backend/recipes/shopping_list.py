@@ -0,0 +1,88 @@
+from django.db import connection
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+UPSERT = (
+    'INSERT INTO {items} (user_id, ingredient_id, total_amount) {select} '
+    'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+    'SET total_amount = {items}.total_amount + excluded.total_amount'
+)
+
+
+def upsert(select, params):
+    items = ShoppingListItem._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(UPSERT.format(items=items, select=select), params)
+
+
+def change_recipes(user_id, recipe_ids, sign):
+    """Прибавляет (sign=1) или вычитает (sign=-1) ингредиенты рецептов
+    в списке покупок пользователя."""
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(recipe_ids))
+    upsert(
+        f'SELECT %s, ingredient_id, %s * SUM(amount) '
+        f'FROM {RecipeIngredient._meta.db_table} '
+        f'WHERE recipe_id IN ({placeholders}) GROUP BY ingredient_id',
+        [user_id, sign, *recipe_ids]
+    )
+    if sign < 0:
+        ShoppingListItem.objects.filter(
+            user_id=user_id, total_amount__lte=0).delete()
+
+
+def change_recipe_ingredients(recipe_id, deltas):
+    """Применяет изменения количества ингредиентов рецепта
+    ({ingredient_id: delta}) ко всем спискам, где есть рецепт."""
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    if not deltas:
+        return
+    values = ' UNION ALL '.join(
+        ['SELECT %s AS ingredient_id, %s AS amount'] * len(deltas))
+    cart = ShoppingCart._meta.db_table
+    upsert(
+        f'SELECT {cart}.user_id, delta.ingredient_id, delta.amount '
+        f'FROM {cart}, ({values}) AS delta '
+        f'WHERE {cart}.recipe_id = %s',
+        [value for item in deltas.items() for value in item] + [recipe_id]
+    )
+    if any(delta < 0 for delta in deltas.values()):
+        ShoppingListItem.objects.filter(
+            ingredient_id__in=deltas, total_amount__lte=0).delete()
+
+
+def remove_recipe(recipe_id):
+    change_recipe_ingredients(recipe_id, {
+        ingredient_id: -amount
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe_id=recipe_id).values_list('ingredient_id', 'amount')
+    })
+
+
+def rebuild_shopping_lists(recipe_ingredient_model, shopping_list_model,
+                           batch_size=1000):
+    shopping_list_model.objects.all().delete()
+    totals = recipe_ingredient_model.objects.filter(
+        recipe__shoppingcart__isnull=False
+    ).values(
+        'recipe__shoppingcart__user', 'ingredient'
+    ).annotate(
+        total=Sum('amount')
+    ).order_by()
+    batch = []
+    for row in totals.iterator():
+        batch.append(shopping_list_model(
+            user_id=row['recipe__shoppingcart__user'],
+            ingredient_id=row['ingredient'],
+            total_amount=row['total']
+        ))
+        if len(batch) == batch_size:
+            shopping_list_model.objects.bulk_create(batch)
+            batch = []
+    shopping_list_model.objects.bulk_create(batch)
@@ -0,0 +1,98 @@
+from functools import partial
+from weakref import WeakKeyDictionary
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from recipes.cache import bump_recipe_versions, bump_version
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag, User
+from recipes.pantry import pantry_index
+from recipes.search import update_search_index
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=Tag)
+def bump_reference_version(sender, **kwargs):
+    bump_version(sender)
+
+
+class RecipeIndexUpdate:
+    """Обновление поиска, индекса кладовой и версий кэша рецептов,
+    измененных в транзакции, одним вызовом после ее фиксации."""
+
+    def __init__(self, using):
+        self.using = using
+        self.changed = set()
+        self.deleted = set()
+
+    def __call__(self):
+        if self.deleted:
+            # Удаление могло откатиться вместе со своей транзакцией.
+            self.deleted -= set(Recipe.objects.using(self.using).filter(
+                pk__in=self.deleted).values_list('pk', flat=True))
+        changed = self.changed - self.deleted
+        if changed:
+            update_search_index(changed)
+        for recipe_id in changed:
+            pantry_index.refresh_recipe(recipe_id)
+        for recipe_id in self.deleted:
+            pantry_index.remove_recipe(recipe_id)
+        bump_recipe_versions(changed | self.deleted)
+
+
+# Обновление, ожидающее фиксации транзакции, по соединению с базой.
+_pending_updates = WeakKeyDictionary()
+
+
+def run_pending_update(connection):
+    update = _pending_updates.pop(connection, None)
+    if update is not None:
+        update()
+
+
+def schedule_recipe_update(recipe_id, deleted=False):
+    """Добавляет рецепт в обновление, которое выполнится после фиксации
+    текущей транзакции; вне транзакции обновляет сразу.
+
+    Каждый вызов регистрирует свой on_commit, выполняет обновление первый
+    из них: так оно не теряется при откате savepoint, в котором было
+    создано. После отката всей транзакции обновление остается в
+    _pending_updates и выполнится со следующей.
+    """
+    connection = transaction.get_connection()
+    update = _pending_updates.get(connection)
+    if update is None:
+        update = _pending_updates[connection] = RecipeIndexUpdate(
+            connection.alias)
+    (update.deleted if deleted else update.changed).add(recipe_id)
+    transaction.on_commit(partial(run_pending_update, connection))
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(instance, raw=False, **kwargs):
+    if not raw:
+        schedule_recipe_update(instance.pk)
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_recipe_from_pantry(instance, **kwargs):
+    # Отмечается до каскадного удаления ингредиентов, чтобы их сигналы
+    # не обновляли индексы удаляемого рецепта.
+    schedule_recipe_update(instance.pk, deleted=True)
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def update_recipe_ingredient_search(instance, raw=False, **kwargs):
+    if not raw:
+        schedule_recipe_update(instance.recipe_id)
+
+
+@receiver(post_save, sender=User)
+def bump_author_recipe_versions(instance, raw=False, update_fields=None,
+                                **kwargs):
+    if raw or update_fields == frozenset(['last_login']):
+        return
+    transaction.on_commit(lambda: bump_recipe_versions(
+        Recipe.objects.filter(
+            author_id=instance.pk).values_list('id', flat=True)))
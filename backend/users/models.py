@@ -20,6 +20,8 @@ class User(AbstractUser):
     password = models.CharField(
         max_length=250,
     )
+    recipes_count = models.PositiveIntegerField(default=0)
+    subscribers_count = models.PositiveIntegerField(default=0)
     REQUIRED_FIELDS = ('email', 'first_name', 'last_name')
 
     def __str__(self):
@@ -32,5 +34,11 @@ class Subscription(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name='subscription_author')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'],
+                                    name='unique_subscription'),
+        ]
+
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
@@ -3,4 +3,9 @@
 python manage.py collectstatic --no-input
 cp -r collected_static/. static/
 python manage.py migrate
-gunicorn foodgram.wsgi:application --bind 0:8000
+if [ "$SERVER_MODE" = "asgi" ]; then
+    gunicorn foodgram.asgi:application --bind 0:8000 \
+        --worker-class uvicorn.workers.UvicornWorker
+else
+    gunicorn foodgram.wsgi:application --bind 0:8000
+fi